@@ -1,17 +1,9 @@
 import os
 from pathlib import Path
-from datetime import datetime, date as dt_date
-import cloudinary.api
-import os
-import cloudinary
-import cloudinary.uploader
+from datetime import datetime, date as dt_date, timedelta
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash
-import base64
 import io
-from PIL import Image
-import numpy as np
-import face_recognition
 import traceback
 
 from flask import (
@@ -22,51 +14,16 @@ from flask_login import LoginManager
 import pytz
 import re
 import random
-import smtplib
-from email.mime.text import MIMEText
-
-from apscheduler.schedulers.background import BackgroundScheduler
 
+from app import live, warmup
+from app.attendance import (
+    LATE, PRESENT, attendance_rate, data_version, day_summary, on_day, parse_day, presence,
+    range_summary, trend
+)
+from app.cohorts import catalog, cohort_revision, enrol
 from app.extensions import db
-
-
-# -----------------------
-# Email helpers
-# -----------------------
-def send_verification_email(to_email, code):
-    """Send verification email with security enhancements"""
-    msg = MIMEText(f"Your verification code is: {code}")
-    msg['Subject'] = "Your Email Verification Code"
-    msg['From'] = os.environ.get('EMAIL_SENDER')
-    msg['To'] = to_email
-
-    try:
-        with smtplib.SMTP(os.environ.get('SMTP_SERVER', 'smtp.gmail.com'),
-                          int(os.environ.get('SMTP_PORT', 587))) as server:
-            server.starttls()
-            server.login(os.environ.get('EMAIL_SENDER'), os.environ.get('EMAIL_PASSWORD'))
-            server.sendmail(os.environ.get('EMAIL_SENDER'), [to_email], msg.as_string())
-    except Exception as e:
-        current_app.logger.error(f"Email sending failed: {str(e)}")
-
-
-def send_absent_email(to_email, student_name, date_str):
-    """Send absence notification email"""
-    msg = MIMEText(
-        f"Dear {student_name},\n\nYou have been marked as ABSENT for {date_str}.\n\n- Attendance Team"
-    )
-    msg['Subject'] = f"Absence Notification for {date_str}"
-    msg['From'] = os.environ.get('EMAIL_SENDER')
-    msg['To'] = to_email
-
-    try:
-        with smtplib.SMTP(os.environ.get('SMTP_SERVER', 'smtp.gmail.com'),
-                          int(os.environ.get('SMTP_PORT', 587))) as server:
-            server.starttls()
-            server.login(os.environ.get('EMAIL_SENDER'), os.environ.get('EMAIL_PASSWORD'))
-            server.sendmail(os.environ.get('EMAIL_SENDER'), [to_email], msg.as_string())
-    except Exception as e:
-        current_app.logger.error(f"Failed to send absent email: {str(e)}")
+from app.http_cache import ResponseCache, make_etag, versioned
+from app.mail import send_verification_email
 
 
 def create_app():
@@ -81,13 +38,8 @@ def create_app():
     app.config['SQLALCHEMY_ENGINE_OPTIONS'] = config.SQLALCHEMY_ENGINE_OPTIONS
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-    # --- Cloudinary config (read from environment / Railway variables) ---
-    cloudinary.config(
-        cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
-        api_key=os.getenv("CLOUDINARY_API_KEY"),
-        api_secret=os.getenv("CLOUDINARY_API_SECRET"),
-        secure=True,
-    )
+    # Heavy imports (face_recognition/dlib, OpenCV, Cloudinary, APScheduler)
+    # happen on first use; app.warmup pays for them before traffic arrives.
 
     # Local file storage (still used for fallbacks if you want)
     app.config['UPLOAD_FOLDER'] = str(Path(app.root_path) / "faces")
@@ -101,12 +53,15 @@ def create_app():
     login_manager.login_view = 'admin.login'
 
     # Import models AFTER db.init_app
-    from app.models.models import User, Attendance , Student
+    from app.models.models import User, Attendance , Student, USER_LISTING
 
     @login_manager.user_loader
     def load_user(user_id):
         return db.session.get(User, int(user_id))
 
+    from app.migrations import upgrade, register_commands
+    from app.jobs import register_commands as register_job_commands
+
     # Register blueprints
     from app.routes.auth import auth_bp
     from app.routes.attendance_scan import attendance_bp
@@ -119,6 +74,39 @@ def create_app():
     # Create tables on boot (works locally; on hosted Postgres it's fine too)
     with app.app_context():
         db.create_all()
+        upgrade()
+    register_commands(app)
+    register_job_commands(app)
+
+    # Campus-wide face index: load the shared copy or build it once
+    from app.vision.ann import campus_index
+
+    campus_index.configure(
+        config.FACE_INDEX_BACKEND,
+        config.FACE_INDEX_PATH or Path(app.instance_path) / "face_index.npz",
+        nprobe=config.FACE_INDEX_NPROBE,
+    )
+    with app.app_context():
+        try:
+            campus_index.ensure_built()
+        except Exception as e:
+            app.logger.error(f"Face index build failed: {e}")
+
+    # Face encoding runs in a bounded process pool; saturation is a fast 503
+    from app.vision.encoder import encoder, EncoderBusy
+    from app.vision.gallery import gallery
+
+    encoder.configure(
+        workers=config.FACE_ENCODER_WORKERS,
+        max_pending=config.FACE_ENCODER_QUEUE,
+        timeout=config.FACE_ENCODER_TIMEOUT,
+    )
+
+    @app.errorhandler(EncoderBusy)
+    def encoder_busy(e):
+        response = jsonify({'status': 'busy', 'success': False, 'message': str(e)})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
 
     # --------- Health check (DB ping) ----------
     @app.route("/health")
@@ -130,6 +118,12 @@ def create_app():
             current_app.logger.error(f"Health check failure: {e}")
             return jsonify({"status": "unhealthy", "database": "disconnected", "error": str(e)}), 500
 
+    # Readiness: 503 until this worker has warmed up its models and gallery
+    @app.route("/ready")
+    def readiness_check():
+        body = dict(warmup.state, encoder_workers=encoder.workers, gallery_generation=gallery.generation)
+        return jsonify(body), 200 if warmup.state['ready'] else 503
+
     # --------- Core routes ----------
     @app.route('/')
     def home():
@@ -147,8 +141,8 @@ def create_app():
     def dashboard():
         date_str = request.args.get('date')
         filter_date = datetime.strptime(date_str, "%Y-%m-%d").date() if date_str else datetime.utcnow().date()
-        users = db.session.query(User).filter(
-            db.func.date(User.created_at) == filter_date
+        users = db.session.query(User).options(USER_LISTING).filter(
+            on_day(User.created_at, filter_date)
         ).order_by(User.created_at.desc()).all()
 
         return render_template(
@@ -181,7 +175,33 @@ def create_app():
             return jsonify({'success': True})
         return jsonify({'success': False, 'message': 'Invalid verification code.'})
 
-    from app.vision.camera import capture_and_store_face
+    from app import storage
+    from app.vision.imaging import BadImage, decode_image, request_image_bytes
+
+    gallery.configure(
+        path=(config.FACE_GALLERY_PATH or Path(app.instance_path) / "face_gallery")
+        if config.FACE_GALLERY_SHARED else None,
+        ttl=config.FACE_GALLERY_TTL,
+    )
+    with app.app_context():
+        try:
+            gallery.ensure_published()
+        except Exception as e:
+            app.logger.error(f"Face gallery snapshot failed: {e}")
+
+    from app.reports import reports
+
+    reports.configure(
+        config.REPORTS_PATH or Path(app.instance_path) / "reports",
+        workers=config.REPORT_WORKERS,
+        cache_days=config.REPORT_CACHE_DAYS,
+    )
+
+    presence.ttl = config.ATTENDANCE_PRESENCE_TTL
+    catalog.ttl = config.COHORT_CATALOG_TTL
+    dashboard_pages = ResponseCache(config.DASHBOARD_CACHE_ENTRIES)
+    live.hub.poll_interval = config.LIVE_POLL_INTERVAL
+    live.hub.max_streams = config.LIVE_MAX_STREAMS
 
     @app.route('/register-face', methods=['POST'])
     def register_face():
@@ -210,25 +230,24 @@ def create_app():
 
             field  = request.form.get('field')
             course = request.form.get('course')
-            image_data = request.form.get('image')
-            if not image_data or not image_data.startswith('data:image'):
-                return jsonify(success=False, message="No image captured. Please click Capture Face before submitting.")
-
-            # --- Decode base64 image -> bytes ---
+            # --- Image: multipart file or legacy base64 data URL ---
             try:
-                header, b64data = image_data.split(',', 1)
-                image_bytes = base64.b64decode(b64data)
-            except Exception:
+                image_bytes = request_image_bytes(request)
+            except BadImage:
                 return jsonify(success=False, message="Invalid image data. Try capturing again.")
+            if not image_bytes:
+                return jsonify(success=False, message="No image captured. Please click Capture Face before submitting.")
 
             # --- Face encoding (no local file writes) ---
+            try:
+                rgb = decode_image(image_bytes, config.REGISTER_MAX_SIDE)
+            except BadImage:
+                return jsonify(success=False, message="Invalid image data. Try capturing again.")
             image_stream = io.BytesIO(image_bytes)
-            pil = Image.open(image_stream).convert("RGB")
-            rgb = np.array(pil)
-            encodings = face_recognition.face_encodings(rgb)
+            encodings = encoder.encode(rgb)
             if not encodings:
                 return jsonify(success=False, message="Face not detected clearly. Please try again.")
-            encoding = encodings[0].tobytes()
+            encoding = encodings[0]
 
             # --- Upload straight to Cloudinary ---
             # Ensure the stream is at the beginning before upload
@@ -236,7 +255,7 @@ def create_app():
             safe_username = re.sub(r'[^A-Za-z0-9_-]', '', username)   # keep only letters, digits, _ and -
             public_id = f"attendance/faces/{safe_username}-{roll}"
 
-            upload_result = cloudinary.uploader.upload(
+            upload_result = storage.upload(
                 image_stream,
                 public_id=public_id,
                 overwrite=True,
@@ -259,7 +278,14 @@ def create_app():
                 email_verification_token=None
             )
             db.session.add(new_user)
+            enrol([(field, course, 1)])
             db.session.commit()
+            catalog.invalidate()
+            gallery.invalidate((field, course))
+            try:
+                campus_index.add(new_user.id, encodings[0])
+            except Exception as e:
+                current_app.logger.error(f"Face index update failed: {e}")
 
             # clear verification state
             for k in ('email_verification_code', 'email_to_verify', 'email_verified'):
@@ -267,6 +293,8 @@ def create_app():
 
             return jsonify(success=True, message=f"{username} registered successfully!", redirect=url_for('dashboard'))
 
+        except EncoderBusy:
+            raise
         except Exception as e:
                 traceback.print_exc()
                 return jsonify(success=False, message=f"Error: {str(e)}")
@@ -299,25 +327,91 @@ def create_app():
         else:
             filter_date = dt_date.today()
 
-        users = User.query.filter_by(field=field, course=course).order_by(User.roll.asc()).all()
-        attendance_records = Attendance.query.filter(
-            Attendance.student_id.in_([u.id for u in users]),
-            db.func.date(Attendance.date) == filter_date
-        ).all()
-        attendance_dict = {}
-        for record in attendance_records:
-            attendance_dict[record.student_id] = record
-        return render_template(
-            'attendance_dashboard.html',
-            users=users,
-            attendance_records=attendance_records,
-            attendance_dict=attendance_dict,
-            field=field,
-            course=course,
-            selected_date=filter_date.strftime("%Y-%m-%d"),
-            today=dt_date.today().strftime("%Y-%m-%d")
+        # the page shows the cohort's roster and 30 days of its attendance;
+        # versions are read before rendering, so a write landing in between
+        # can only make the cached body newer than its ETag
+        today = dt_date.today()
+        month_start = filter_date - timedelta(days=29)
+        etag = make_etag(
+            field, course, filter_date, today,
+            cohort_revision(field, course), data_version(field, course, month_start, filter_date),
         )
 
+        def render():
+            users = User.query.options(USER_LISTING).filter_by(field=field, course=course).order_by(User.roll.asc()).all()
+            attendance_records = Attendance.query.filter(
+                Attendance.student_id.in_([u.id for u in users]),
+                on_day(Attendance.date, filter_date)
+            ).all()
+            attendance_dict = {}
+            for record in attendance_records:
+                attendance_dict[record.student_id] = record
+
+            # counters and rates come from the daily rollup, not the rows above
+            counts = day_summary(field, course, filter_date)
+            recent = range_summary(field, course, month_start, filter_date)
+            week_start = filter_date - timedelta(days=6)
+            summary = dict(
+                counts,
+                students=len(users),
+                unmarked=max(len(users) - counts['present'] - counts['late'], 0),
+                week_rate=attendance_rate([r for r in recent if r['day'] >= week_start], len(users)),
+                month_rate=attendance_rate(recent, len(users)),
+            )
+            return render_template(
+                'attendance_dashboard.html',
+                users=users,
+                attendance_records=attendance_records,
+                attendance_dict=attendance_dict,
+                summary=summary,
+                statuses={'present': PRESENT, 'late': LATE},
+                field=field,
+                course=course,
+                selected_date=filter_date.strftime("%Y-%m-%d"),
+                today=today.strftime("%Y-%m-%d")
+            )
+
+        return versioned(
+            etag, render, cache=dashboard_pages, key=(field, course, filter_date),
+            max_age=config.DASHBOARD_PAST_MAX_AGE if filter_date < today else 0,
+        )
+
+    # Server-Sent Events for an open dashboard: a snapshot of the day's
+    # marks, then one `mark` event per change (see app/live.py)
+    @app.route('/attendance-dashboard/<field>/<course>/events')
+    def attendance_dashboard_events(field, course):
+        day = parse_day(request.args.get('date')) or dt_date.today()
+        subscribed = live.hub.subscribe(app, field, course, day)
+        if subscribed is None:
+            return jsonify(success=False, message="Too many live dashboards open."), 503, {'Retry-After': '30'}
+        sub, snapshot = subscribed
+        response = app.response_class(
+            live.stream(sub, snapshot, config.LIVE_STREAM_SECONDS, config.LIVE_HEARTBEAT_SECONDS),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'}
+        )
+        response.call_on_close(lambda: live.hub.unsubscribe(sub))
+        return response
+
+    # Attendance trend for a cohort from the daily rollup:
+    # ?start=&end= (default: the last 30 days), period=day|week|month
+    @app.route('/attendance-summary/<field>/<course>')
+    def attendance_summary(field, course):
+        end = parse_day(request.args.get('end')) or dt_date.today()
+        start = parse_day(request.args.get('start')) or end - timedelta(days=29)
+        period = request.args.get('period') if request.args.get('period') in ('day', 'week', 'month') else 'week'
+        students = catalog.students(field, course)
+        return jsonify({
+            'field': field,
+            'course': course,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'period': period,
+            'students': students,
+            'end_counts': day_summary(field, course, end),
+            'trend': trend(field, course, start, end, period, students),
+        })
+
     def format_local_time(dt, tz_name='Asia/Kolkata', fmt='%Y-%m-%d %H:%M'):
         if not dt:
             return ''
@@ -330,48 +424,35 @@ def create_app():
 
     app.jinja_env.filters['format_local_time'] = format_local_time
 
+    # The encoder pool, warm-up and scheduler are not started here: CLI
+    # commands and scripts only need the app and its context. Servers call
+    # start_background() per process (run.py, gunicorn.conf.py hooks).
+    return app
+
+
+def start_background(app):
+    """
+    Per-process machinery for a process that serves requests: encoder
+    processes first (they fork), warm-up, then threads.
+    """
+    from app.vision.encoder import encoder
+
+    encoder.start()
+    warmup.warm_up(app)
+
     # -------- Optional in-app scheduler (avoid on Render) --------
     if os.environ.get("ENABLE_SCHEDULER") == "true":
-        def mark_absent_students(field, course, on_date=None):
-            from app.models.models import User, Attendance  # local import
-            if not on_date:
-                on_date = datetime.utcnow().date()
-
-            # with db.session.begin():
-                users = db.session.query(User).filter_by(field=field, course=course).all()
-                present_ids = {
-                    r.student_id for r in db.session.query(Attendance).filter(
-                        Attendance.field == field,
-                        Attendance.course == course,
-                        db.func.date(Attendance.date) == on_date,
-                        Attendance.status.in_(['✅Present', '⏰Present-Late'])
-                    )
-                }
-                for user in users:
-                    if user.id not in present_ids:
-                        absent_record = Attendance(
-                            student_id=user.id,
-                            date=datetime.utcnow(),
-                            status='❌Absent',
-                            field=field,
-                            course=course
-                        )
-                        db.session.add(absent_record)
-                        try:
-                            send_absent_email(user.email, user.username, on_date.strftime('%Y-%m-%d'))
-                        except Exception as e:
-                            current_app.logger.error(f"Failed to send email to {user.email}: {str(e)}")
-                db.session.commit()
-
-        def run_absent_job():
-            from app.models.models import User
-            with app.app_context():
-                fields_courses = db.session.query(User.field, User.course).distinct().all()
-                for field, course in fields_courses:
-                    mark_absent_students(field, course)
+        from apscheduler.schedulers.background import BackgroundScheduler
+        from app.jobs import run_absent_job
 
         scheduler = BackgroundScheduler()
-        scheduler.add_job(run_absent_job, 'cron', hour=11, minute=31, timezone='Asia/Kolkata')
+        scheduler.add_job(run_absent_job, 'cron', args=[app], hour=11, minute=31, timezone='Asia/Kolkata')
         scheduler.start()
 
-    return app
+
+def after_fork(app):
+    """gunicorn post_fork hook for a preloaded app (see gunicorn.conf.py)."""
+    with app.app_context():
+        # connections opened in the master must not be shared with workers
+        db.engine.dispose(close=False)
+    start_background(app)
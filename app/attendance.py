@@ -0,0 +1,596 @@
+"""
+Attendance rules and write helpers shared by the scan endpoints.
+"""
+import threading
+from datetime import date, datetime, time, timedelta
+from time import monotonic
+
+import pytz
+
+from app.extensions import db, upsert_insert
+
+
+PRESENT = '✅Present'
+LATE = '⏰Present-Late'
+ABSENT = '❌Absent'
+
+LOCAL_TZ = pytz.timezone('Asia/Kolkata')
+
+
+def local_now():
+    return datetime.now(LOCAL_TZ)
+
+
+def parse_day(value):
+    """date / datetime / 'YYYY-MM-DD' -> date; None for empty or invalid input."""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def day_bounds(day):
+    """Half-open [start, end) timestamp range covering one calendar day."""
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+
+def on_day(column, day):
+    """
+    Sargable replacement for `func.date(column) == day`: a range predicate
+    that can use an index on the timestamp column.
+    """
+    start, end = day_bounds(parse_day(day))
+    return db.and_(column >= start, column < end)
+
+
+def status_for(now):
+    """Present until 09:15, late until 11:30, None once the window has closed."""
+    present_time = now.replace(hour=9, minute=15, second=0, microsecond=0)
+    late_time = now.replace(hour=11, minute=30, second=0, microsecond=0)
+    if now <= present_time:
+        return PRESENT
+    if now <= late_time:
+        return LATE
+    return None
+
+
+def already_marked(student_ids, field, course, day):
+    """Subset of student_ids that already have an attendance row on `day`."""
+    from app.models.models import Attendance
+
+    if not student_ids:
+        return set()
+    rows = db.session.query(Attendance.student_id).filter(
+        Attendance.student_id.in_(student_ids),
+        Attendance.field == field,
+        Attendance.course == course,
+        on_day(Attendance.date, day)
+    )
+    return {r.student_id for r in rows}
+
+
+class PresenceCache:
+    """
+    Student ids that already have an attendance row today, per
+    (field, course), so repeat scans are answered without a query.
+
+    A cohort's set is loaded from the database on first use and re-read
+    after `ttl` seconds, which lets marks and deletions made by other
+    workers show up. Only one day is held: everything is dropped when the
+    attendance day rolls over. A miss is never trusted - callers fall back
+    to the database - so a stale set can only cost a query.
+    """
+
+    def __init__(self, ttl=60.0):
+        self.ttl = ttl
+        self._day = None
+        self._cohorts = {}  # (field, course) -> (loaded_at, set of student ids)
+        self._lock = threading.Lock()
+
+    def contains(self, student_id, field, course, day):
+        return student_id in self._members(field, course, day)
+
+    def add(self, student_ids, field, course, day):
+        with self._lock:
+            if not self._roll(day):
+                return
+            entry = self._cohorts.get((field, course))
+            if entry is not None:
+                entry[1].update(student_ids)
+
+    def discard(self, student_id, field, course, day):
+        with self._lock:
+            if not self._roll(day):
+                return
+            entry = self._cohorts.get((field, course))
+            if entry is not None:
+                entry[1].discard(student_id)
+
+    def invalidate(self):
+        with self._lock:
+            self._cohorts = {}
+
+    def _roll(self, day):
+        """Switch to `day` if it is newer; False for a past day (not cached)."""
+        if self._day is None or day > self._day:
+            self._day = day
+            self._cohorts = {}
+        return day == self._day
+
+    def _members(self, field, course, day):
+        with self._lock:
+            if not self._roll(day):
+                return set()
+            entry = self._cohorts.get((field, course))
+            if entry is not None and monotonic() - entry[0] < self.ttl:
+                return entry[1]
+
+        loaded_at = monotonic()
+        members = _cohort_marked(field, course, day)
+        with self._lock:
+            if day == self._day:
+                self._cohorts[(field, course)] = (loaded_at, members)
+        return members
+
+
+def _cohort_marked(field, course, day):
+    from app.models.models import Attendance
+
+    rows = db.session.query(Attendance.student_id).filter(
+        Attendance.field == field,
+        Attendance.course == course,
+        on_day(Attendance.date, day)
+    )
+    return {r.student_id for r in rows}
+
+
+presence = PresenceCache()
+
+
+def insert_new(rows):
+    """
+    Insert attendance rows, silently skipping any that would duplicate an
+    existing (student, field, course, day) row. Uses the dialect's
+    ON CONFLICT DO NOTHING against the unique daily index, so concurrent
+    kiosks cannot race. Returns the student ids that were actually inserted.
+    Does not commit.
+    """
+    from app.models.models import Attendance
+
+    if not rows:
+        return []
+    for row in rows:
+        row.setdefault('attendance_day', row['date'].date())
+
+    insert = upsert_insert()
+    if insert is None:
+        return _insert_new_generic(rows)
+
+    stmt = insert(Attendance).on_conflict_do_nothing(
+        index_elements=['student_id', 'field', 'course', 'attendance_day']
+    ).returning(Attendance.student_id)
+    return [r.student_id for r in db.session.execute(stmt, rows)]
+
+
+def _insert_new_generic(rows):
+    from sqlalchemy.exc import IntegrityError
+    from app.models.models import Attendance
+
+    inserted = []
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(db.insert(Attendance), [row])
+            inserted.append(row['student_id'])
+        except IntegrityError:
+            pass
+    return inserted
+
+
+def _accumulate(table, rows, columns):
+    """
+    Insert per-(field, course, day) rows, adding `columns` onto the
+    existing row for a key instead when there is one. Does not commit.
+    """
+    insert = upsert_insert()
+    if insert is not None:
+        stmt = insert(table)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['field', 'course', 'day'],
+            set_={name: table.c[name] + stmt.excluded[name] for name in columns}
+        ), rows)
+        return
+
+    from sqlalchemy.exc import IntegrityError
+
+    for row in rows:
+        key = (table.c.field == row['field']) & (table.c.course == row['course']) & (table.c.day == row['day'])
+        add = db.update(table).where(key).values({name: table.c[name] + row[name] for name in columns})
+        if db.session.execute(add).rowcount:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.execute(db.insert(table), [row])
+        except IntegrityError:
+            db.session.execute(add)
+
+
+def touch(keys):
+    """
+    Bump the revision of every (field, course, day) in `keys` after writing
+    attendance rows there. Call in the writer's transaction; does not commit.
+    """
+    from app.models.models import AttendanceRevision
+
+    rows = [
+        {'field': field or '', 'course': course or '', 'day': day, 'revision': 1}
+        for field, course, day in set(keys)
+    ]
+    if rows:
+        _accumulate(AttendanceRevision.__table__, rows, ['revision'])
+
+
+def student_keys(student_id, day=None):
+    """
+    touch() keys for a student's cohort: on `day`, or on every day they
+    have attendance when `day` is None.
+    """
+    from app.models.models import User, Attendance
+
+    if day is not None:
+        cohort = db.session.query(User.field, User.course).filter(User.id == student_id).first()
+        return [(cohort.field, cohort.course, day)] if cohort else []
+    return db.session.query(User.field, User.course, Attendance.attendance_day).join(
+        Attendance, Attendance.student_id == User.id
+    ).filter(User.id == student_id).distinct().all()
+
+
+def data_version(field=None, course=None, start=None, end=None):
+    """
+    Version of the attendance for a cohort (None: all) over an inclusive
+    range of days. Revisions only grow, so the sum changes on any write.
+    """
+    from app.models.models import AttendanceRevision as Rev
+
+    query = db.session.query(db.func.count(), db.func.coalesce(db.func.sum(Rev.revision), 0))
+    if field:
+        query = query.filter(Rev.field == field)
+    if course:
+        query = query.filter(Rev.course == course)
+    if parse_day(start):
+        query = query.filter(Rev.day >= parse_day(start))
+    if parse_day(end):
+        query = query.filter(Rev.day <= parse_day(end))
+    count, total = query.one()
+    return f"{count}.{total}"
+
+
+# -------------------------
+# Daily rollups
+# -------------------------
+SUMMARY_COUNTS = ('total', 'present', 'late', 'absent')
+_STATUS_COUNTS = {PRESENT: 'present', LATE: 'late', ABSENT: 'absent'}
+
+
+def tally(changes):
+    """
+    Apply (field, course, day, status, +n/-n) changes to the daily summary
+    and bump the revision of each day touched. Call in the writer's
+    transaction; does not commit.
+    """
+    from app.models.models import DailyAttendanceSummary
+
+    deltas = {}
+    for field, course, day, status, delta in changes:
+        counts = deltas.setdefault((field or '', course or '', day), dict.fromkeys(SUMMARY_COUNTS, 0))
+        counts['total'] += delta
+        if status in _STATUS_COUNTS:
+            counts[_STATUS_COUNTS[status]] += delta
+
+    rows = [
+        dict(counts, field=field, course=course, day=day)
+        for (field, course, day), counts in deltas.items() if any(counts.values())
+    ]
+    if rows:
+        _accumulate(DailyAttendanceSummary.__table__, rows, SUMMARY_COUNTS)
+    touch(deltas)
+
+
+def rebuild_summary(keys=None, conn=None):
+    """
+    Recount the daily summary from the attendance table: all of it, or only
+    the (field, course, day) keys given. Runs on `conn` (default: the
+    session); does not commit. Returns the number of summary rows written.
+    """
+    from app.models.models import User, Attendance, DailyAttendanceSummary as Summary
+
+    conn = conn or db.session
+    if keys is not None:
+        keys = {(field or '', course or '', day) for field, course, day in keys}
+        if not keys:
+            return 0
+
+    def count(status):
+        return db.func.sum(db.case((Attendance.status == status, 1), else_=0))
+
+    counts = db.select(
+        User.field, User.course, Attendance.attendance_day,
+        db.func.count(Attendance.id), count(PRESENT), count(LATE), count(ABSENT)
+    ).join(User, Attendance.student_id == User.id).group_by(
+        User.field, User.course, Attendance.attendance_day
+    )
+    clear = db.delete(Summary)
+    if keys is not None:
+        counts = counts.where(db.tuple_(User.field, User.course, Attendance.attendance_day).in_(keys))
+        clear = clear.where(db.tuple_(Summary.field, Summary.course, Summary.day).in_(keys))
+
+    conn.execute(clear)
+    result = conn.execute(db.insert(Summary).from_select(
+        ['field', 'course', 'day', *SUMMARY_COUNTS], counts
+    ))
+    return result.rowcount
+
+
+def recount(keys):
+    """rebuild_summary() and touch() for days whose rows changed wholesale."""
+    keys = set(keys)
+    rebuild_summary(keys)
+    touch(keys)
+
+
+def _summary_query(field, course, *columns):
+    from app.models.models import DailyAttendanceSummary as Summary
+
+    query = db.session.query(*columns, *(
+        db.func.coalesce(db.func.sum(getattr(Summary, name)), 0) for name in SUMMARY_COUNTS
+    ))
+    if field:
+        query = query.filter(Summary.field == field)
+    if course:
+        query = query.filter(Summary.course == course)
+    return query
+
+
+def day_summary(field, course, day):
+    """{total, present, late, absent} for a cohort (None: all) on one day."""
+    from app.models.models import DailyAttendanceSummary as Summary
+
+    row = _summary_query(field, course).filter(Summary.day == day).one()
+    return dict(zip(SUMMARY_COUNTS, row))
+
+
+def range_summary(field, course, start, end):
+    """Per-day counts for a cohort over an inclusive range of days, oldest first."""
+    from app.models.models import DailyAttendanceSummary as Summary
+
+    rows = _summary_query(field, course, Summary.day).filter(
+        Summary.day >= start, Summary.day <= end
+    ).group_by(Summary.day).order_by(Summary.day)
+    return [dict(zip(('day', *SUMMARY_COUNTS), row)) for row in rows]
+
+
+def attendance_rate(rows, students):
+    """
+    Percentage present or late over per-day summary rows. Each day expects
+    a mark from every enrolled student (or every row, if there are more).
+    """
+    expected = sum(max(row['total'], students) for row in rows)
+    if not expected:
+        return None
+    return round(100.0 * sum(row['present'] + row['late'] for row in rows) / expected, 1)
+
+
+def trend(field, course, start, end, period='week', students=0):
+    """
+    Attendance per day, ISO week or month over an inclusive range of days,
+    from one range scan of the daily summary. Days without any attendance
+    rows (holidays, weekends) are left out.
+    """
+    buckets = {}
+    for row in range_summary(field, course, start, end):
+        day = row['day']
+        if period == 'month':
+            key = day.replace(day=1)
+        elif period == 'week':
+            key = day - timedelta(days=day.weekday())
+        else:
+            key = day
+        buckets.setdefault(key, []).append(row)
+    return [
+        dict(
+            {name: sum(row[name] for row in rows) for name in SUMMARY_COUNTS},
+            start=key.isoformat(), days=len(rows), rate=attendance_rate(rows, students),
+        )
+        for key, rows in sorted(buckets.items())
+    ]
+
+
+# -------------------------
+# Per-student counters
+# -------------------------
+STATS_FIELDS = (*SUMMARY_COUNTS, 'streak', 'last_seen', 'last_day')
+
+
+def _empty_stats(student_id):
+    return dict(dict.fromkeys(STATS_FIELDS, 0), student_id=student_id, last_seen=None, last_day=None)
+
+
+def _count_row(stats, day, status):
+    """Add one attendance row to a student's counters, rows taken oldest first."""
+    later = stats['last_day'] is None or day > stats['last_day']
+    stats['total'] += 1
+    if status in _STATUS_COUNTS:
+        stats[_STATUS_COUNTS[status]] += 1
+    if status in (PRESENT, LATE):
+        if later:
+            stats['streak'] += 1
+        if stats['last_seen'] is None or day > stats['last_seen']:
+            stats['last_seen'] = day
+    elif later:
+        stats['streak'] = 0
+    if later:
+        stats['last_day'] = day
+
+
+def record_stats(student_ids, day, status):
+    """
+    Count one new attendance row on `day` per student. Meant for rows that
+    are the students' latest (kiosk marks, today's absent job); past days
+    go through recount_students(). Does not commit.
+    """
+    from app.models.models import StudentAttendanceStats as Stats
+
+    ids = list(dict.fromkeys(student_ids))
+    if not ids:
+        return
+    insert = upsert_insert()
+    if insert is None:
+        return recount_students(ids)
+
+    first = _empty_stats(None)
+    _count_row(first, day, status)
+    table = Stats.__table__
+    stmt = insert(table)
+    old, new = table.c, stmt.excluded
+    later = db.or_(old.last_day.is_(None), old.last_day < new.last_day)
+    updates = {name: old[name] + new[name] for name in SUMMARY_COUNTS}
+    updates['last_day'] = db.case((later, new.last_day), else_=old.last_day)
+    if status in (PRESENT, LATE):
+        updates['streak'] = db.case((later, old.streak + 1), else_=old.streak)
+        updates['last_seen'] = db.case(
+            (db.or_(old.last_seen.is_(None), old.last_seen < new.last_seen), new.last_seen),
+            else_=old.last_seen
+        )
+    else:
+        updates['streak'] = db.case((later, 0), else_=old.streak)
+
+    db.session.execute(
+        stmt.on_conflict_do_update(index_elements=['student_id'], set_=updates),
+        [dict(first, student_id=sid) for sid in ids]
+    )
+
+
+def _stats_from_history(rows):
+    """Counters per student from (student_id, day, status) rows ordered by student, day."""
+    stats = None
+    for student_id, day, status in rows:
+        if stats is None or stats['student_id'] != student_id:
+            if stats is not None:
+                yield stats
+            stats = _empty_stats(student_id)
+        _count_row(stats, day, status)
+    if stats is not None:
+        yield stats
+
+
+def _history(query_filter=None):
+    from app.models.models import Attendance
+
+    stmt = db.select(Attendance.student_id, Attendance.attendance_day, Attendance.status)
+    if query_filter is not None:
+        stmt = stmt.where(query_filter)
+    return stmt.order_by(Attendance.student_id, Attendance.attendance_day, Attendance.id)
+
+
+def recount_students(student_ids):
+    """Recompute these students' counters from their attendance history. Does not commit."""
+    from app.models.models import Attendance, StudentAttendanceStats as Stats
+
+    ids = [int(sid) for sid in dict.fromkeys(student_ids)]
+    if not ids:
+        return
+    rows = db.session.execute(_history(Attendance.student_id.in_(ids)))
+    stats = list(_stats_from_history(rows))
+    db.session.execute(db.delete(Stats).where(Stats.student_id.in_(ids)))
+    if stats:
+        db.session.execute(db.insert(Stats), stats)
+
+
+def rebuild_stats(conn=None, batch_size=1000):
+    """
+    Recompute every student's counters, streaming the attendance table
+    once. Runs on `conn` (default: the session); does not commit. Returns
+    the number of students with counters.
+    """
+    from app.models.models import StudentAttendanceStats as Stats
+
+    conn = conn or db.session
+    conn.execute(db.delete(Stats))
+    rows = conn.execute(_history().execution_options(yield_per=batch_size))
+    written, pending = 0, []
+    for stats in _stats_from_history(rows):
+        pending.append(stats)
+        if len(pending) >= batch_size:
+            conn.execute(db.insert(Stats), pending)
+            written += len(pending)
+            pending = []
+    if pending:
+        conn.execute(db.insert(Stats), pending)
+        written += len(pending)
+    return written
+
+
+def student_counts(student_id, start=None, end=None):
+    """{total, present, late, absent} for one student over an inclusive range of days."""
+    from app.models.models import Attendance
+
+    def count(status):
+        return db.func.coalesce(db.func.sum(db.case((Attendance.status == status, 1), else_=0)), 0)
+
+    query = db.session.query(
+        db.func.count(Attendance.id), count(PRESENT), count(LATE), count(ABSENT)
+    ).filter(Attendance.student_id == student_id)
+    if parse_day(start):
+        query = query.filter(Attendance.date >= day_bounds(parse_day(start))[0])
+    if parse_day(end):
+        query = query.filter(Attendance.date < day_bounds(parse_day(end))[1])
+    return dict(zip(SUMMARY_COUNTS, query.one()))
+
+
+def mark_many(student_ids, field, course, status, now):
+    """
+    Mark every student not yet marked today in one statement and one
+    transaction. Returns the ids that were newly marked.
+    """
+    stamp = datetime.utcnow()
+    day = stamp.date()
+    pending = [sid for sid in dict.fromkeys(student_ids) if not presence.contains(sid, field, course, day)]
+    if not pending:
+        return []
+    new_ids = insert_new([
+        {'student_id': sid, 'date': stamp, 'status': status, 'field': field, 'course': course}
+        for sid in pending
+    ])
+    if new_ids:
+        tally([(field, course, day, status, len(new_ids))])
+        record_stats(new_ids, day, status)
+    db.session.commit()
+    # ids skipped by the upsert were marked by someone else: present either way
+    presence.add(pending, field, course, day)
+    if new_ids:
+        from app.live import hub
+
+        hub.publish(field, course, day, [(sid, status, stamp) for sid in new_ids])
+    return new_ids
+
+
+def mark_one(student_id, field, course, now):
+    """
+    Record one scan. Returns 'marked', 'already_marked' or 'closed'.
+    """
+    today = datetime.utcnow().date()
+    if presence.contains(student_id, field, course, today):
+        return 'already_marked'
+    status = status_for(now)
+    if status is None:
+        if already_marked([student_id], field, course, today):
+            return 'already_marked'
+        return 'closed'
+    return 'marked' if mark_many([student_id], field, course, status, now) else 'already_marked'
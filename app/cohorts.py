@@ -0,0 +1,146 @@
+"""
+Catalog of (field, course) cohorts and how many students each has.
+
+The `cohort` table is adjusted in the same transaction as every student
+write (enrol), so the admin field/course menus and roster counts read a
+handful of rows instead of running DISTINCT over attendance_student. Each
+worker also holds the catalog in memory: writes in this process drop it at
+once (catalog.invalidate), and writes in other workers show up after `ttl`
+seconds.
+"""
+import threading
+from time import monotonic
+
+from app.extensions import db, upsert_insert
+
+
+def enrol(changes):
+    """
+    Apply (field, course, +n/-n) student changes to the cohort table and
+    bump the revision of each cohort named (a 0 change marks an edit). Call
+    in the writer's transaction; does not commit. Invalidate the catalog
+    once the transaction has committed.
+    """
+    from app.models.models import Cohort
+
+    deltas = {}
+    for field, course, delta in changes:
+        deltas[(field, course)] = deltas.get((field, course), 0) + delta
+    rows = [dict(field=field, course=course, students=delta, revision=1) for (field, course), delta in deltas.items()]
+    if not rows:
+        return
+
+    table = Cohort.__table__
+    insert = upsert_insert()
+    if insert is not None:
+        stmt = insert(table)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['field', 'course'],
+            set_={name: table.c[name] + stmt.excluded[name] for name in ('students', 'revision')}
+        ), rows)
+        return
+
+    from sqlalchemy.exc import IntegrityError
+
+    for row in rows:
+        add = db.update(table).where(
+            (table.c.field == row['field']) & (table.c.course == row['course'])
+        ).values(students=table.c.students + row['students'], revision=table.c.revision + 1)
+        if db.session.execute(add).rowcount:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.execute(db.insert(table), [row])
+        except IntegrityError:
+            db.session.execute(add)
+
+
+def cohort_revision(field, course):
+    """Current revision of a cohort's student list (0 if it has none)."""
+    from app.models.models import Cohort
+
+    return db.session.query(Cohort.revision).filter(
+        Cohort.field == field, Cohort.course == course
+    ).scalar() or 0
+
+
+def rebuild(conn=None):
+    """
+    Recount the cohort table from attendance_student. Runs on `conn`
+    (default: the session); does not commit. Returns the number of cohorts.
+    Revisions carry on from the old rows, so cached pages still go stale.
+    """
+    from app.models.models import User, Cohort
+
+    conn = conn or db.session
+    start = conn.execute(db.select(db.func.coalesce(db.func.max(Cohort.revision), 0))).scalar() + 1
+    conn.execute(db.delete(Cohort))
+    result = conn.execute(db.insert(Cohort).from_select(
+        ['field', 'course', 'students', 'revision'],
+        db.select(User.field, User.course, db.func.count(User.id), db.literal(start))
+        .group_by(User.field, User.course)
+    ))
+    return result.rowcount
+
+
+class CohortCatalog:
+    """Every cohort with students, cached per worker for `ttl` seconds."""
+
+    def __init__(self, ttl=60.0):
+        self.ttl = ttl
+        self._loaded_at = None
+        self._cohorts = ()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def cohorts(self):
+        """(field, course, students) tuples, sorted by field and course."""
+        with self._lock:
+            if self._loaded_at is not None and monotonic() - self._loaded_at < self.ttl:
+                return self._cohorts
+            generation = self._generation
+
+        loaded_at = monotonic()
+        cohorts = _load()
+        with self._lock:
+            # a write committed while loading may be missing from `cohorts`
+            if generation == self._generation:
+                self._loaded_at, self._cohorts = loaded_at, cohorts
+        return cohorts
+
+    def fields(self):
+        return sorted({field for field, _, _ in self.cohorts()})
+
+    def courses(self, field=None):
+        return sorted({course for f, course, _ in self.cohorts() if not field or f == field})
+
+    def course_map(self):
+        """{field: [course, ...]} for the field -> course menus."""
+        menus = {}
+        for field, course, _ in self.cohorts():
+            menus.setdefault(field, []).append(course)
+        return menus
+
+    def students(self, field=None, course=None):
+        """Students enrolled in a cohort (None: any field / course)."""
+        return sum(
+            count for f, c, count in self.cohorts()
+            if (not field or f == field) and (not course or c == course)
+        )
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._loaded_at = None
+
+
+def _load():
+    from app.models.models import Cohort
+
+    rows = db.session.query(Cohort.field, Cohort.course, Cohort.students).filter(
+        Cohort.students > 0
+    ).order_by(Cohort.field, Cohort.course)
+    return tuple(tuple(row) for row in rows)
+
+
+catalog = CohortCatalog()
@@ -25,6 +25,14 @@ EMAIL_SENDER = os.environ.get("EMAIL_SENDER")
 EMAIL_PASSWORD = os.environ.get("EMAIL_PASSWORD")
 SMTP_SERVER = os.environ.get("SMTP_SERVER", "smtp.gmail.com")
 SMTP_PORT = int(os.environ.get("SMTP_PORT", 587))
+SMTP_USE_TLS = os.environ.get("SMTP_USE_TLS", "true").lower() == "true"
+SMTP_TIMEOUT = float(os.environ.get("SMTP_TIMEOUT", 30))
+
+# Outbox: sender threads (one SMTP connection each), messages sent per
+# connection round, and retries (with exponential backoff) per message.
+EMAIL_WORKERS = int(os.environ.get("EMAIL_WORKERS", 2))
+EMAIL_BATCH_SIZE = int(os.environ.get("EMAIL_BATCH_SIZE", 20))
+EMAIL_MAX_RETRIES = int(os.environ.get("EMAIL_MAX_RETRIES", 3))
 
 # -------------------------
 # Cloudinary Configuration
@@ -33,9 +41,97 @@ CLOUDINARY_CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME")
 CLOUDINARY_API_KEY = os.getenv("CLOUDINARY_API_KEY")
 CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
 
+# -------------------------
+# Face Recognition
+# -------------------------
+# Cohort matrices are slices of one memory-mapped snapshot of every enrolled
+# face under FACE_GALLERY_PATH (default: <instance>/face_gallery), shared by
+# all workers; enrolment changes publish a new generation that workers remap.
+# FACE_GALLERY_SHARED=false caches per process instead, reloading a cohort
+# after FACE_GALLERY_TTL seconds so enrolments by other workers show up.
+FACE_GALLERY_SHARED = os.environ.get("FACE_GALLERY_SHARED", "true").lower() == "true"
+FACE_GALLERY_PATH = os.environ.get("FACE_GALLERY_PATH")
+FACE_GALLERY_TTL = float(os.environ.get("FACE_GALLERY_TTL", 60))
+
+# A scan is accepted when the nearest enrolled face is within the tolerance
+# and the runner-up is at least FACE_MATCH_MARGIN further away.
+FACE_MATCH_TOLERANCE = float(os.environ.get("FACE_MATCH_TOLERANCE", 0.6))
+FACE_MATCH_MARGIN = float(os.environ.get("FACE_MATCH_MARGIN", 0.05))
+
+# Campus-wide search (kiosks without a field/course) uses an ANN index:
+# "ivf" (pure NumPy), "hnsw" (needs hnswlib) or "none" to disable it, in
+# which case campus kiosks scan the whole face gallery exactly.
+# The index is persisted to FACE_INDEX_PATH (default: <instance>/face_index.npz)
+# so gunicorn workers share one build.
+FACE_INDEX_BACKEND = os.environ.get("FACE_INDEX_BACKEND", "ivf")
+FACE_INDEX_PATH = os.environ.get("FACE_INDEX_PATH")
+FACE_INDEX_NPROBE = int(os.environ.get("FACE_INDEX_NPROBE", 8))
+
+# Detection stage run before encoding: "haar" (bundled OpenCV cascade),
+# "hog-small" (dlib HOG on a half-size copy) or "hog" (full-size dlib HOG).
+FACE_DETECTOR = os.environ.get("FACE_DETECTOR", "haar")
+
+# Longest side uploaded frames are decoded to (aspect ratio is kept).
+# Classroom snapshots (/scan-frame) need more pixels than a kiosk close-up.
+SCAN_FACE_MAX_SIDE = int(os.environ.get("SCAN_FACE_MAX_SIDE", 300))
+SCAN_FRAME_MAX_SIDE = int(os.environ.get("SCAN_FRAME_MAX_SIDE", 1280))
+REGISTER_MAX_SIDE = int(os.environ.get("REGISTER_MAX_SIDE", 640))
+SCAN_STREAM_MAX_SIDE = int(os.environ.get("SCAN_STREAM_MAX_SIDE", 480))
+
+# Encoder processes per web worker (gunicorn runs 2 workers, so the default
+# splits the cores between them; 0 encodes in the request thread), how many
+# frames may be queued or running before new ones get a 503, and how long a
+# frame may wait before it is dropped as stale.
+FACE_ENCODER_WORKERS = int(
+    os.environ.get("FACE_ENCODER_WORKERS", max(1, (os.cpu_count() or 2) // 2))
+)
+FACE_ENCODER_QUEUE = int(os.environ.get("FACE_ENCODER_QUEUE", 2 * FACE_ENCODER_WORKERS + 2))
+FACE_ENCODER_TIMEOUT = float(os.environ.get("FACE_ENCODER_TIMEOUT", 5))
+
 # -------------------------
 # Attendance Rules
 # -------------------------
 ATTENDANCE_THRESHOLD_HOUR = int(
     os.environ.get("ATTENDANCE_THRESHOLD_HOUR", 9)
 )
+
+# Seconds a cached "already marked today" set for a (field, course) is
+# trusted before it is re-read, so marks and deletions made by other workers
+# show up.
+ATTENDANCE_PRESENCE_TTL = float(os.environ.get("ATTENDANCE_PRESENCE_TTL", 60))
+
+# Seconds a worker trusts its in-memory cohort catalog (field/course menus,
+# roster counts) before re-reading it, so enrolments made by other workers
+# show up.
+COHORT_CATALOG_TTL = float(os.environ.get("COHORT_CATALOG_TTL", 60))
+
+# Attendance dashboards are served with ETags. Today's page is revalidated
+# on every request; pages for past days may be reused by browsers for
+# DASHBOARD_PAST_MAX_AGE seconds. Each worker keeps the latest rendering of
+# up to DASHBOARD_CACHE_ENTRIES (field, course, day) pages.
+DASHBOARD_PAST_MAX_AGE = int(os.environ.get("DASHBOARD_PAST_MAX_AGE", 86400))
+DASHBOARD_CACHE_ENTRIES = int(os.environ.get("DASHBOARD_CACHE_ENTRIES", 256))
+
+# Live dashboard streams (Server-Sent Events). Each open stream holds one
+# gthread thread, so a worker accepts at most LIVE_MAX_STREAMS of them and
+# ends each after LIVE_STREAM_SECONDS (the browser reconnects). Changes made
+# by other workers are picked up every LIVE_POLL_INTERVAL seconds.
+LIVE_MAX_STREAMS = int(os.environ.get("LIVE_MAX_STREAMS", 4))
+LIVE_STREAM_SECONDS = int(os.environ.get("LIVE_STREAM_SECONDS", 300))
+LIVE_POLL_INTERVAL = float(os.environ.get("LIVE_POLL_INTERVAL", 2))
+LIVE_HEARTBEAT_SECONDS = float(os.environ.get("LIVE_HEARTBEAT_SECONDS", 15))
+
+# -------------------------
+# Exports
+# -------------------------
+# Rows fetched from the server-side cursor and encoded per chunk when
+# streaming an attendance export.
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 1000))
+
+# PDF reports are rendered by REPORT_WORKERS background threads per web
+# worker and cached under REPORTS_PATH (default: <instance>/reports) until
+# the attendance they cover changes; artifacts unused for REPORT_CACHE_DAYS
+# are removed.
+REPORTS_PATH = os.environ.get("REPORTS_PATH")
+REPORT_WORKERS = int(os.environ.get("REPORT_WORKERS", 1))
+REPORT_CACHE_DAYS = float(os.environ.get("REPORT_CACHE_DAYS", 7))
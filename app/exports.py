@@ -0,0 +1,134 @@
+"""
+Streaming attendance exports.
+
+Rows are read as a flat (student, roll, field, course, date, status)
+projection through a server-side cursor (`yield_per`: psycopg2 uses a
+named cursor, SQLite fetches in batches) and encoded a batch at a time, so
+an export holds one batch in memory however long the date range is.
+"""
+import csv
+import io
+import json
+
+from app import config
+from app.attendance import day_bounds, parse_day
+from app.extensions import db
+from app.models.models import User, Attendance
+
+
+COLUMNS = ('student', 'roll', 'field', 'course', 'date', 'status')
+
+def export_query(field=None, course=None, start=None, end=None):
+    """
+    SELECT of the export projection for a cohort and an inclusive range of
+    days (either end may be open), oldest first.
+    """
+    stmt = db.select(
+        User.username, User.roll, User.field, User.course, Attendance.date, Attendance.status
+    ).join(User, Attendance.student_id == User.id)
+    if field:
+        stmt = stmt.where(User.field == field)
+    if course:
+        stmt = stmt.where(User.course == course)
+    if parse_day(start):
+        stmt = stmt.where(Attendance.date >= day_bounds(parse_day(start))[0])
+    if parse_day(end):
+        stmt = stmt.where(Attendance.date < day_bounds(parse_day(end))[1])
+    return stmt.order_by(Attendance.date.asc(), Attendance.id.asc())
+
+
+def iter_batches(stmt, batch_size=None):
+    """Lists of result rows, `batch_size` at a time, from a server-side cursor."""
+    batch_size = batch_size or config.EXPORT_BATCH_SIZE
+    result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+    try:
+        yield from result.partitions()
+    finally:
+        result.close()
+
+
+def _display_date(stamp):
+    return stamp.strftime('%Y-%m-%d %H:%M')
+
+
+def csv_chunks(batches):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(['Student', 'Roll', 'Field', 'Course', 'Date', 'Status'])
+    for batch in batches:
+        writer.writerows(
+            (name, roll, field, course, _display_date(stamp), status)
+            for name, roll, field, course, stamp, status in batch
+        )
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()
+
+
+def ndjson_chunks(batches):
+    for batch in batches:
+        yield ''.join(
+            json.dumps(dict(zip(COLUMNS, (name, roll, field, course, stamp.isoformat(), status))),
+                       ensure_ascii=False) + '\n'
+            for name, roll, field, course, stamp, status in batch
+        )
+
+
+class _ChunkSink:
+    """Write-only file for pyarrow that hands back what was written since the last drain."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def parquet_chunks(batches):
+    """One Parquet row group per batch; needs the optional `pyarrow` package."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('student', pa.string()), ('roll', pa.int64()), ('field', pa.string()),
+        ('course', pa.string()), ('date', pa.timestamp('us')), ('status', pa.string()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema)
+    try:
+        for batch in batches:
+            writer.write_table(pa.Table.from_pylist(
+                [dict(zip(COLUMNS, row)) for row in batch], schema=schema
+            ))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+# format -> (mimetype, chunk encoder)
+FORMATS = {
+    'csv': ('text/csv', csv_chunks),
+    'ndjson': ('application/x-ndjson', ndjson_chunks),
+    'parquet': ('application/vnd.apache.parquet', parquet_chunks),
+}
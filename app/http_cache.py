@@ -0,0 +1,64 @@
+"""
+Versioned HTTP caching for pages rendered from counters that change rarely.
+
+A page's ETag hashes the versions of everything it shows (attendance
+revisions, the cohort revision, ...), which cost a couple of primary-key
+lookups. A client sending the current ETag in If-None-Match gets a 304
+without the page's queries or template running; other clients asking for
+the same version are served the body this worker rendered last.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from flask import Response, request
+
+
+def make_etag(*parts):
+    """Strong ETag value for a JSON-serialisable version tuple."""
+    return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()
+
+
+class ResponseCache:
+    """Latest rendered body per key, with the ETag it was rendered for (per worker, LRU)."""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, etag):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != etag:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, etag, body):
+        with self._lock:
+            self._entries[key] = (etag, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def versioned(etag, render, cache=None, key=None, max_age=0, mimetype='text/html'):
+    """
+    Response for content at version `etag`: a 304 when the client already
+    has it, else the cached body or `render()`. `max_age` > 0 lets clients
+    reuse the page without asking; 0 makes them revalidate every time.
+    """
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        body = cache.get(key, etag) if cache is not None else None
+        if body is None:
+            body = render()
+            if cache is not None:
+                cache.put(key, etag, body)
+        response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f"private, max-age={max_age}" if max_age else 'private, no-cache'
+    return response
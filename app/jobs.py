@@ -0,0 +1,152 @@
+"""
+Scheduled jobs.
+
+The absent job is a single set-based INSERT ... SELECT across every cohort,
+so it takes one short transaction whatever the number of students. Absence
+emails are handed to the outbox only after that transaction has committed.
+"""
+import time
+from datetime import datetime
+
+import click
+
+from app import attendance
+from app.extensions import db
+
+
+def mark_absent_students(on_date=None, notify=True):
+    """
+    Insert an absent row for every student with no attendance row on
+    `on_date` (UTC date, today by default). Returns a timing report.
+    """
+    from app.models.models import User, Attendance
+
+    now = datetime.utcnow()
+    on_date = on_date or now.date()
+    # rows for a past day (manual re-runs) are stamped at the end of that day
+    stamp = now if on_date == now.date() else datetime.combine(on_date, datetime.max.time()).replace(microsecond=0)
+    start = time.perf_counter()
+
+    marked = db.select(Attendance.id).where(
+        Attendance.student_id == User.id,
+        Attendance.field == User.field,
+        Attendance.course == User.course,
+        attendance.on_day(Attendance.date, on_date)
+    )
+    missing = db.select(
+        User.id, db.literal(stamp), db.literal(on_date),
+        db.literal(attendance.ABSENT), User.field, User.course
+    ).where(~marked.exists())
+
+    # a past day's rows all get the same stamp, so a re-run's rows are told
+    # apart from earlier runs' by id
+    boundary = db.session.query(db.func.coalesce(db.func.max(Attendance.id), 0)).scalar()
+    inserted = (Attendance.id > boundary, Attendance.date == stamp, Attendance.status == attendance.ABSENT)
+
+    result = db.session.execute(
+        db.insert(Attendance).from_select(
+            ['student_id', 'date', 'attendance_day', 'status', 'field', 'course'], missing
+        )
+    )
+    if result.rowcount:
+        cohorts = db.session.query(Attendance.field, Attendance.course, db.func.count()).filter(
+            *inserted
+        ).group_by(Attendance.field, Attendance.course)
+        attendance.tally(
+            (field, course, on_date, attendance.ABSENT, count) for field, course, count in cohorts
+        )
+        absentees = [sid for sid, in db.session.query(Attendance.student_id).filter(*inserted)]
+        if on_date == now.date():
+            attendance.record_stats(absentees, on_date, attendance.ABSENT)
+        else:
+            attendance.recount_students(absentees)
+    db.session.commit()
+    attendance.presence.invalidate()
+    rows = result.rowcount
+    elapsed = time.perf_counter() - start
+
+    job = None
+    if notify and rows:
+        job = notify_absentees(stamp, on_date, boundary)
+
+    return {
+        'date': on_date.strftime('%Y-%m-%d'),
+        'rows': rows,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed, 1) if elapsed else None,
+        'email_job': job.id if job else None,
+    }
+
+
+def notify_absentees(stamp, on_date, after_id=0):
+    """
+    Queue absence emails for the rows written by one absent-job run: those
+    stamped `stamp` with an id above `after_id`, the largest id before it.
+    """
+    from app.models.models import User, Attendance
+    from app.mail import send_absent_emails
+
+    recipients = db.session.query(User.email, User.username).join(
+        Attendance, Attendance.student_id == User.id
+    ).filter(
+        Attendance.id > after_id,
+        Attendance.date == stamp,
+        Attendance.status == attendance.ABSENT
+    ).all()
+    return send_absent_emails(recipients, on_date.strftime('%Y-%m-%d'))
+
+
+def run_absent_job(app):
+    with app.app_context():
+        report = mark_absent_students()
+        app.logger.info(
+            f"Absent job {report['date']}: {report['rows']} rows in {report['seconds']}s "
+            f"({report['rows_per_second']} rows/s)"
+        )
+        return report
+
+
+def register_commands(app):
+    @app.cli.command('mark-absent')
+    @click.option('--date', 'date_str', help="UTC date (YYYY-MM-DD), defaults to today.")
+    @click.option('--no-email', is_flag=True, help="Do not queue absence emails.")
+    def mark_absent_command(date_str, no_email):
+        """Mark every student without attendance on the date as absent."""
+        on_date = datetime.strptime(date_str, "%Y-%m-%d").date() if date_str else None
+        report = mark_absent_students(on_date, notify=not no_email)
+        click.echo(
+            f"{report['date']}: {report['rows']} rows in {report['seconds']}s "
+            f"({report['rows_per_second']} rows/s)"
+        )
+        if report['email_job']:
+            from app.mail import outbox
+
+            job = outbox.job(report['email_job'])
+            while not job.done:
+                time.sleep(0.5)
+            click.echo(f"Emails: {job.sent} sent, {job.failed} failed.")
+
+    @app.cli.command('rebuild-summary')
+    def rebuild_summary_command():
+        """Recount daily_attendance_summary from the attendance table."""
+        start = time.perf_counter()
+        rows = attendance.rebuild_summary()
+        db.session.commit()
+        click.echo(f"{rows} summary rows in {time.perf_counter() - start:.3f}s")
+
+    @app.cli.command('rebuild-stats')
+    def rebuild_stats_command():
+        """Recompute every student's attendance counters from the attendance table."""
+        start = time.perf_counter()
+        students = attendance.rebuild_stats()
+        db.session.commit()
+        click.echo(f"{students} students in {time.perf_counter() - start:.3f}s")
+
+    @app.cli.command('rebuild-cohorts')
+    def rebuild_cohorts_command():
+        """Recount the cohort catalog from the student table."""
+        from app import cohorts
+
+        rows = cohorts.rebuild()
+        db.session.commit()
+        click.echo(f"{rows} cohorts")
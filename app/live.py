@@ -0,0 +1,226 @@
+"""
+Live attendance dashboards over Server-Sent Events.
+
+A stream follows one (field, course, day). Each worker's hub keeps, for
+every topic that has listeners, the status and time of each student's
+attendance row, and pushes only what changed as a `mark` event
+{student_id, status, date, time} (status null: the row was deleted).
+
+Writes made in this worker are published as soon as they commit. Every
+LIVE_POLL_INTERVAL seconds a poller thread also compares each topic's
+attendance_revision with the one it last saw and re-reads the topic's
+rows when it moved, which picks up marks taken by other gunicorn workers,
+the absent job and admin edits. When the cohort's student list changes
+(cohort.revision) the stream sends `reload` instead, since rows cannot
+describe a new or renamed student.
+
+Each stream holds a gthread worker thread, so a worker serves at most
+LIVE_MAX_STREAMS of them and closes each after LIVE_STREAM_SECONDS; the
+browser's EventSource reconnects and starts again from a snapshot.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+
+import pytz
+
+from app.attendance import LOCAL_TZ, on_day
+from app.extensions import db
+
+
+log = logging.getLogger(__name__)
+
+
+def _event(row):
+    """Event fields for a (status, stamp) row, or for no row."""
+    status, stamp = row or (None, None)
+    return {
+        'status': status,
+        'date': stamp.isoformat() if stamp else None,
+        'time': pytz.utc.localize(stamp).astimezone(LOCAL_TZ).strftime('%Y-%m-%d %H:%M') if stamp else None,
+    }
+
+
+class Subscription:
+    def __init__(self, key, max_queue):
+        self.key = key
+        self.events = queue.Queue(max_queue)
+        self.stale = False  # fell behind; the client must reload
+
+    def push(self, name, data):
+        try:
+            self.events.put_nowait((name, data))
+        except queue.Full:
+            self.stale = True
+
+
+class _Topic:
+    def __init__(self, field, course, day):
+        self.key = (field, course, day)
+        self.subscribers = set()
+        self.revision = _attendance_revisions([self.key]).get(self.key, 0)
+        self.roster = _cohort_revisions([(field, course)]).get((field, course), 0)
+        self.rows = _topic_rows(field, course, day)
+
+    def items(self):
+        return [dict(_event(row), student_id=student_id) for student_id, row in self.rows.items()]
+
+    def apply(self, changes):
+        """Record (student_id, status, stamp) changes and push the ones that are new."""
+        for student_id, status, stamp in changes:
+            row = (status, stamp) if status else None
+            if self.rows.get(student_id) == row:
+                continue
+            if row:
+                self.rows[student_id] = row
+            else:
+                self.rows.pop(student_id, None)
+            data = dict(_event(row), student_id=student_id)
+            for sub in self.subscribers:
+                sub.push('mark', data)
+
+
+class LiveHub:
+    def __init__(self, poll_interval=2.0, max_streams=4, max_queue=256):
+        self.poll_interval = poll_interval
+        self.max_streams = max_streams
+        self.max_queue = max_queue
+        self._topics = {}  # (field, course, day) -> _Topic
+        self._streams = 0
+        self._lock = threading.Lock()  # also held while a topic's rows are read and diffed
+        self._thread = None
+
+    # -- public API -------------------------------------------------------
+    def subscribe(self, app, field, course, day):
+        """
+        (Subscription, snapshot items) for a topic, or None when this worker
+        already serves max_streams. Needs an app context.
+        """
+        key = (field, course, day)
+        with self._lock:
+            if self._streams >= self.max_streams:
+                return None
+            topic = self._topics.get(key)
+            if topic is None:
+                topic = self._topics[key] = _Topic(*key)
+            sub = Subscription(key, self.max_queue)
+            topic.subscribers.add(sub)
+            self._streams += 1
+            snapshot = topic.items()
+        self._ensure_started(app)
+        return sub, snapshot
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._streams -= 1
+            topic = self._topics.get(sub.key)
+            if topic is not None:
+                topic.subscribers.discard(sub)
+                if not topic.subscribers:
+                    del self._topics[sub.key]
+
+    def publish(self, field, course, day, changes):
+        """Fan out committed (student_id, status or None, stamp) changes to listeners."""
+        with self._lock:
+            topic = self._topics.get((field, course, day))
+            if topic is not None:
+                topic.apply(changes)
+
+    # -- internals --------------------------------------------------------
+    def _ensure_started(self, app):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, args=(app,), name="live-poller", daemon=True)
+                self._thread.start()
+
+    def _run(self, app):
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                keys = list(self._topics)
+            if not keys:
+                continue
+            try:
+                with app.app_context():
+                    self._poll(keys)
+            except Exception as e:
+                log.error(f"Live dashboard poll failed: {e}")
+
+    def _poll(self, keys):
+        revisions = _attendance_revisions(keys)
+        rosters = _cohort_revisions({key[:2] for key in keys})
+        with self._lock:
+            for key in keys:
+                topic = self._topics.get(key)
+                if topic is None:
+                    continue
+                if rosters.get(key[:2], 0) != topic.roster:
+                    for sub in topic.subscribers:
+                        sub.push('reload', {})
+                    del self._topics[key]
+                elif revisions.get(key, 0) != topic.revision:
+                    topic.revision = revisions.get(key, 0)
+                    rows = _topic_rows(*key)
+                    topic.apply(
+                        [(sid, None, None) for sid in topic.rows.keys() - rows.keys()]
+                        + [(sid, status, stamp) for sid, (status, stamp) in rows.items()]
+                    )
+
+
+def _attendance_revisions(keys):
+    from app.models.models import AttendanceRevision as Rev
+
+    rows = db.session.query(Rev.field, Rev.course, Rev.day, Rev.revision).filter(
+        db.tuple_(Rev.field, Rev.course, Rev.day).in_(list(keys))
+    )
+    return {(field, course, day): revision for field, course, day, revision in rows}
+
+
+def _cohort_revisions(cohorts):
+    from app.models.models import Cohort
+
+    rows = db.session.query(Cohort.field, Cohort.course, Cohort.revision).filter(
+        db.tuple_(Cohort.field, Cohort.course).in_(list(cohorts))
+    )
+    return {(field, course): revision for field, course, revision in rows}
+
+
+def _topic_rows(field, course, day):
+    from app.models.models import Attendance
+
+    rows = db.session.query(Attendance.student_id, Attendance.status, Attendance.date).filter(
+        Attendance.field == field,
+        Attendance.course == course,
+        on_day(Attendance.date, day)
+    )
+    return {sid: (status, stamp) for sid, status, stamp in rows}
+
+
+def _format(name, data):
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream(sub, snapshot, seconds, heartbeat):
+    """
+    SSE body for one subscription: a snapshot, then deltas until `seconds`
+    have passed. The caller unsubscribes when the response is closed.
+    """
+    deadline = time.monotonic() + seconds
+    yield "retry: 3000\n" + _format('snapshot', {'items': snapshot})
+    while time.monotonic() < deadline:
+        if sub.stale:
+            yield _format('reload', {})
+            return
+        try:
+            name, data = sub.events.get(timeout=min(heartbeat, max(deadline - time.monotonic(), 0.01)))
+        except queue.Empty:
+            yield ": keepalive\n\n"
+            continue
+        yield _format(name, data)
+        if name == 'reload':
+            return
+
+
+hub = LiveHub()
@@ -0,0 +1,237 @@
+"""
+Email outbox: messages are queued and delivered by a small pool of worker
+threads, each holding one authenticated SMTP connection that is reused
+across messages and batches.
+
+Callers never talk to SMTP directly; they enqueue and get a job back whose
+progress (sent / failed / pending) can be polled. Failed sends are retried
+with exponential backoff.
+
+For local testing point it at a debugging server, e.g.
+
+    python -m aiosmtpd -n -l localhost:1025
+    SMTP_SERVER=localhost SMTP_PORT=1025 SMTP_USE_TLS=false
+"""
+import itertools
+import logging
+import queue
+import smtplib
+import threading
+import time
+import uuid
+from email.mime.text import MIMEText
+
+from app import config
+
+
+log = logging.getLogger(__name__)
+
+
+class EmailJob:
+    """Progress of one batch of queued messages."""
+
+    def __init__(self, total, label=''):
+        self.id = uuid.uuid4().hex
+        self.label = label
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.errors = []
+        self.created_at = time.time()
+        self._lock = threading.Lock()
+
+    @property
+    def done(self):
+        return self.sent + self.failed >= self.total
+
+    def record(self, ok, error=None):
+        with self._lock:
+            if ok:
+                self.sent += 1
+            else:
+                self.failed += 1
+                self.errors.append(error)
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'label': self.label,
+            'total': self.total,
+            'sent': self.sent,
+            'failed': self.failed,
+            'pending': self.total - self.sent - self.failed,
+            'done': self.done,
+            'errors': self.errors[-10:],
+        }
+
+
+class _Message:
+    __slots__ = ('msg', 'recipients', 'job', 'attempt')
+
+    def __init__(self, msg, recipients, job):
+        self.msg = msg
+        self.recipients = recipients
+        self.job = job
+        self.attempt = 0
+
+
+class Outbox:
+    def __init__(self, workers=2, batch_size=20, max_retries=3, backoff=2.0, idle_timeout=30.0):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+
+        # (ready_at, seq, message): retries wait in the same queue until due
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._jobs = {}
+        self._threads = []
+        self._lock = threading.Lock()
+
+    # -- public API -------------------------------------------------------
+    def enqueue(self, messages, label=''):
+        """Queue (MIMEText, [recipients]) pairs; returns the EmailJob tracking them."""
+        messages = list(messages)
+        job = EmailJob(len(messages), label)
+        with self._lock:
+            self._prune_jobs()
+            self._jobs[job.id] = job
+        self._ensure_started()
+        for msg, recipients in messages:
+            self._put(_Message(msg, recipients, job))
+        return job
+
+    def job(self, job_id):
+        return self._jobs.get(job_id)
+
+    # -- internals --------------------------------------------------------
+    def _put(self, item, delay=0.0):
+        self._queue.put((time.monotonic() + delay, next(self._seq), item))
+
+    def _prune_jobs(self, keep_seconds=3600):
+        cutoff = time.time() - keep_seconds
+        for job_id in [j.id for j in self._jobs.values() if j.done and j.created_at < cutoff]:
+            del self._jobs[job_id]
+
+    def _ensure_started(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                t = threading.Thread(target=self._run, name=f"email-outbox-{len(self._threads)}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _next_batch(self):
+        """Block for the first due message, then take whatever else is due."""
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                ready_at, seq, item = self._queue.get(timeout=None if not batch else 0.05)
+            except queue.Empty:
+                break
+            wait = ready_at - time.monotonic()
+            if wait > 0:
+                # not due yet: put it back and come back for it later
+                self._queue.put((ready_at, seq, item))
+                if batch:
+                    break
+                time.sleep(min(wait, 1.0))
+                continue
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        conn = None
+        last_used = 0.0
+        while True:
+            batch = self._next_batch()
+            if conn is not None and time.monotonic() - last_used > self.idle_timeout:
+                conn = _close(conn)
+
+            for item in batch:
+                try:
+                    if conn is None:
+                        conn = _connect()
+                    conn.sendmail(config.EMAIL_SENDER, item.recipients, item.msg.as_string())
+                    item.job.record(True)
+                except Exception as e:
+                    # a broken connection is rebuilt for the next attempt
+                    if isinstance(e, (smtplib.SMTPServerDisconnected, OSError)):
+                        conn = _close(conn)
+                    self._retry(item, e)
+            last_used = time.monotonic()
+
+    def _retry(self, item, error):
+        item.attempt += 1
+        if item.attempt > self.max_retries:
+            log.error(f"Email to {', '.join(item.recipients)} failed: {error}")
+            item.job.record(False, f"{', '.join(item.recipients)}: {error}")
+            return
+        self._put(item, delay=self.backoff ** item.attempt)
+
+
+def _connect():
+    conn = smtplib.SMTP(config.SMTP_SERVER, config.SMTP_PORT, timeout=config.SMTP_TIMEOUT)
+    if config.SMTP_USE_TLS:
+        conn.starttls()
+    if config.EMAIL_PASSWORD:
+        conn.login(config.EMAIL_SENDER, config.EMAIL_PASSWORD)
+    return conn
+
+
+def _close(conn):
+    if conn is not None:
+        try:
+            conn.quit()
+        except Exception:
+            pass
+    return None
+
+
+outbox = Outbox(
+    workers=config.EMAIL_WORKERS,
+    batch_size=config.EMAIL_BATCH_SIZE,
+    max_retries=config.EMAIL_MAX_RETRIES,
+)
+
+
+# -----------------------
+# Message builders
+# -----------------------
+def build_message(to_email, subject, body):
+    msg = MIMEText(body)
+    msg['Subject'] = subject
+    msg['From'] = config.EMAIL_SENDER
+    msg['To'] = to_email
+    return msg, [to_email]
+
+
+def absent_message(to_email, student_name, date_str):
+    return build_message(
+        to_email,
+        f"Absence Notification for {date_str}",
+        f"Dear {student_name},\n\nYou have been marked as ABSENT for {date_str}.\n\n- Attendance Team"
+    )
+
+
+def send_verification_email(to_email, code):
+    """Queue the email verification code."""
+    return outbox.enqueue(
+        [build_message(to_email, "Your Email Verification Code", f"Your verification code is: {code}")],
+        label='verification'
+    )
+
+
+def send_absent_email(to_email, student_name, date_str):
+    """Queue one absence notification."""
+    return outbox.enqueue([absent_message(to_email, student_name, date_str)], label='absent')
+
+
+def send_absent_emails(recipients, date_str):
+    """Queue absence notifications for (email, name) pairs as one job."""
+    return outbox.enqueue(
+        [absent_message(email, name, date_str) for email, name in recipients],
+        label=f'absent {date_str}'
+    )
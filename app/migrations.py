@@ -0,0 +1,146 @@
+"""
+Small, ordered data/schema migrations for tables that db.create_all() cannot
+alter once they exist.
+
+Each migration runs once, in its own transaction, and is recorded in the
+`schema_migrations` table. upgrade() is called on boot (right after
+create_all) and is also available as `flask --app run upgrade-db`.
+"""
+import click
+from sqlalchemy import text, bindparam, inspect, type_coerce, LargeBinary
+
+from app.extensions import db
+
+
+def _face_encoding_float32(conn):
+    """Rewrite pickled float64 face encodings as tagged float32 bytes."""
+    from app.models.models import User
+    from app.models.types import encode_face, decode_face, is_current
+
+    raw = type_coerce(User.face_encoding, LargeBinary)
+    rows = conn.execute(
+        db.select(User.id, raw).where(User.face_encoding.isnot(None))
+    ).all()
+    updates = [
+        {'row_id': row_id, 'blob': encode_face(decode_face(blob))}
+        for row_id, blob in rows if not is_current(bytes(blob))
+    ]
+    if updates:
+        conn.execute(
+            text("UPDATE attendance_student SET face_encoding = :blob WHERE id = :row_id")
+            .bindparams(bindparam('blob', type_=LargeBinary)),
+            updates
+        )
+
+
+def _create_indexes(conn, names):
+    """Create model-declared indexes by name, skipping any that already exist."""
+    indexes = {index.name: index for table in db.metadata.sorted_tables for index in table.indexes}
+    for name in names:
+        indexes[name].create(conn, checkfirst=True)
+
+
+def _attendance_indexes(conn):
+    """Composite indexes for the per-day attendance and cohort lookups."""
+    _create_indexes(conn, [
+        'ix_attendance_student_field_course',
+        'ix_attendance_student_id_date',
+        'ix_attendance_field_course_date',
+        'ix_attendance_date',
+    ])
+
+
+def _attendance_daily_unique(conn):
+    """
+    Add attendance.attendance_day, keep only the latest row per student,
+    cohort and day, then enforce that with a unique index.
+    """
+    columns = {c['name'] for c in inspect(conn).get_columns('attendance')}
+    if 'attendance_day' not in columns:
+        conn.execute(text("ALTER TABLE attendance ADD COLUMN attendance_day DATE"))
+    conn.execute(text("UPDATE attendance SET attendance_day = DATE(date) WHERE attendance_day IS NULL"))
+    conn.execute(text(
+        "DELETE FROM attendance WHERE id NOT IN ("
+        "SELECT MAX(id) FROM attendance GROUP BY student_id, field, course, attendance_day)"
+    ))
+    _create_indexes(conn, ['uq_attendance_daily'])
+
+
+def _attendance_keyset_index(conn):
+    """(date, id) index the paged admin attendance views seek through."""
+    _create_indexes(conn, ['ix_attendance_date_id'])
+
+
+def _daily_summary_backfill(conn):
+    """Fill daily_attendance_summary from the existing attendance history."""
+    from app.attendance import rebuild_summary
+
+    rebuild_summary(conn=conn)
+
+
+def _student_stats_backfill(conn):
+    """Fill student_attendance_stats from the existing attendance history."""
+    from app.attendance import rebuild_stats
+
+    rebuild_stats(conn=conn)
+
+
+def _cohort_backfill(conn):
+    """Fill the cohort table from the existing students."""
+    from app.cohorts import rebuild
+
+    rebuild(conn=conn)
+
+
+def _cohort_revision(conn):
+    """Add cohort.revision, which dashboard ETags use to see roster edits."""
+    columns = {c['name'] for c in inspect(conn).get_columns('cohort')}
+    if 'revision' not in columns:
+        conn.execute(text("ALTER TABLE cohort ADD COLUMN revision INTEGER NOT NULL DEFAULT 0"))
+
+
+# (name, function) in the order they must be applied. Never reorder or rename.
+MIGRATIONS = [
+    ('0001_face_encoding_float32', _face_encoding_float32),
+    ('0002_attendance_indexes', _attendance_indexes),
+    ('0003_attendance_daily_unique', _attendance_daily_unique),
+    ('0004_attendance_keyset_index', _attendance_keyset_index),
+    ('0005_daily_summary_backfill', _daily_summary_backfill),
+    ('0006_student_stats_backfill', _student_stats_backfill),
+    ('0007_cohort_backfill', _cohort_backfill),
+    ('0008_cohort_revision', _cohort_revision),
+]
+
+
+def upgrade():
+    """Apply every pending migration; returns the names that were applied."""
+    with db.engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "name VARCHAR(100) PRIMARY KEY, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+        ))
+
+    applied = []
+    for name, migrate in MIGRATIONS:
+        with db.engine.begin() as conn:
+            if conn.dialect.name == 'postgresql':
+                # serialise concurrent gunicorn workers booting at once
+                conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('schema_migrations'))"))
+            done = conn.execute(
+                text("SELECT 1 FROM schema_migrations WHERE name = :name"), {'name': name}
+            ).first()
+            if done:
+                continue
+            migrate(conn)
+            conn.execute(text("INSERT INTO schema_migrations (name) VALUES (:name)"), {'name': name})
+            applied.append(name)
+    return applied
+
+
+def register_commands(app):
+    @app.cli.command('upgrade-db')
+    def upgrade_db_command():
+        """Create missing tables and apply pending migrations."""
+        db.create_all()
+        applied = upgrade()
+        click.echo(f"Applied: {', '.join(applied)}" if applied else "Database is up to date.")
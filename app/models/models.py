@@ -2,23 +2,29 @@ from datetime import datetime
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from app.extensions import db
+from app.models.types import FaceEncoding
 
 class User(db.Model, UserMixin):
     __tablename__ = 'attendance_student'
+    __table_args__ = (
+        db.Index('ix_attendance_student_field_course', 'field', 'course'),
+    )
     id = db.Column(db.Integer, primary_key=True)
 
     username = db.Column(db.String(150), unique=True, nullable=False)
     email = db.Column(db.String(150), unique=True, nullable=False)
     roll = db.Column(db.Integer, nullable=False)
 
-    # auth
-    password_hash = db.Column(db.String(200), nullable=True)
+    # auth (deferred: only login needs it)
+    password_hash = db.deferred(db.Column(db.String(200), nullable=True))
 
     # face & meta
     image_path = db.Column(db.String(300))
     field = db.Column(db.String(100), nullable=False)
     course = db.Column(db.String(100), nullable=False)
-    face_encoding = db.Column(db.PickleType)  # numpy array
+    # float32 numpy array; deferred so listings never fetch and decode the
+    # blob (recognition reads the column directly, see load_face_matrix)
+    face_encoding = db.deferred(db.Column(FaceEncoding))
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_email_verified = db.Column(db.Boolean, default=False)
@@ -34,15 +40,37 @@ class User(db.Model, UserMixin):
         return check_password_hash(self.password_hash, raw_password)
 
 
+# Columns the student listing pages render: query(User).options(USER_LISTING)
+USER_LISTING = db.load_only(
+    User.id, User.username, User.email, User.roll, User.field, User.course,
+    User.image_path, User.created_at,
+)
+
+
 class Student(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100))
 
 
+def _attendance_day(context):
+    stamp = context.get_current_parameters().get('date') or datetime.utcnow()
+    return stamp.date()
+
+
 class Attendance(db.Model):
+    __table_args__ = (
+        db.Index('ix_attendance_student_id_date', 'student_id', 'date'),
+        db.Index('ix_attendance_field_course_date', 'field', 'course', 'date'),
+        db.Index('ix_attendance_date', 'date'),
+        # keyset pagination of the admin attendance tables: ORDER BY date, id
+        db.Index('ix_attendance_date_id', 'date', 'id'),
+        # one row per student, cohort and day; writers rely on it for upserts
+        db.Index('uq_attendance_daily', 'student_id', 'field', 'course', 'attendance_day', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('attendance_student.id'))
     date = db.Column(db.DateTime, default=datetime.utcnow)
+    attendance_day = db.Column(db.Date, default=_attendance_day)  # UTC day of `date`
     status = db.Column(db.String(32), default='Present')
     field = db.Column(db.String(100))
     course = db.Column(db.String(100))
@@ -50,6 +78,71 @@ class Attendance(db.Model):
     student = db.relationship('User', backref='attendances')
 
 
+class AttendanceRevision(db.Model):
+    """
+    Write counter per (field, course, day), bumped in the same transaction
+    as every attendance write (see attendance.touch), so anything cached
+    from a cohort's attendance can tell when it went stale.
+    Field and course are the student's cohort; '' when unknown.
+    """
+    __tablename__ = 'attendance_revision'
+    field = db.Column(db.String(100), primary_key=True)
+    course = db.Column(db.String(100), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    revision = db.Column(db.Integer, nullable=False, default=0)
+
+
+class DailyAttendanceSummary(db.Model):
+    """
+    Attendance counts per (field, course, day), kept up to date by every
+    attendance write (attendance.tally) and rebuildable from the attendance
+    table (attendance.rebuild_summary). Keyed like AttendanceRevision.
+    """
+    __tablename__ = 'daily_attendance_summary'
+    __table_args__ = (
+        db.Index('ix_daily_attendance_summary_day', 'day'),
+    )
+    field = db.Column(db.String(100), primary_key=True)
+    course = db.Column(db.String(100), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)  # rows, whatever their status
+    present = db.Column(db.Integer, nullable=False, default=0)
+    late = db.Column(db.Integer, nullable=False, default=0)
+    absent = db.Column(db.Integer, nullable=False, default=0)
+
+
+class StudentAttendanceStats(db.Model):
+    """
+    Running attendance counters per student, kept up to date by every
+    attendance write (attendance.record_stats / recount_students) and
+    rebuildable from the attendance table (attendance.rebuild_stats).
+    """
+    __tablename__ = 'student_attendance_stats'
+    student_id = db.Column(db.Integer, db.ForeignKey('attendance_student.id'), primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    present = db.Column(db.Integer, nullable=False, default=0)
+    late = db.Column(db.Integer, nullable=False, default=0)
+    absent = db.Column(db.Integer, nullable=False, default=0)
+    streak = db.Column(db.Integer, nullable=False, default=0)  # latest consecutive days present or late
+    last_seen = db.Column(db.Date)  # latest day present or late
+    last_day = db.Column(db.Date)   # latest day with any attendance row
+
+
+class Cohort(db.Model):
+    """
+    Students enrolled per (field, course), adjusted by every student write
+    (cohorts.enrol) and rebuildable from attendance_student
+    (cohorts.rebuild). Rows whose count drops to 0 stay until a rebuild.
+    `revision` is bumped by every write to a cohort's students, including
+    edits that leave the count alone.
+    """
+    __tablename__ = 'cohort'
+    field = db.Column(db.String(100), primary_key=True)
+    course = db.Column(db.String(100), primary_key=True)
+    students = db.Column(db.Integer, nullable=False, default=0)
+    revision = db.Column(db.Integer, nullable=False, default=0)
+
+
 class Admin(db.Model):
     __tablename__ = 'admins'
     id = db.Column(db.Integer, primary_key=True)
@@ -0,0 +1,79 @@
+import pickle
+import struct
+
+import numpy as np
+from sqlalchemy.types import LargeBinary, TypeDecorator
+
+
+FACE_DIM = 128
+
+# Every stored embedding starts with a 2-byte tag: format version, dtype code.
+# Pickled rows written by the old PickleType column start with 0x80 instead.
+_HEADER = struct.Struct('<BB')
+_VERSION = 1
+_DTYPES = {1: np.dtype('<f4')}
+_DTYPE_CODES = {v: k for k, v in _DTYPES.items()}
+_DTYPE = _DTYPES[1]
+_BLOB_SIZE = _HEADER.size + FACE_DIM * _DTYPE.itemsize  # 514 bytes
+
+
+def encode_face(encoding):
+    """128-d embedding -> tagged float32 bytes (or None)."""
+    if encoding is None:
+        return None
+    if isinstance(encoding, (bytes, bytearray, memoryview)):
+        if is_current(bytes(encoding)):
+            return bytes(encoding)
+        # raw float64 buffer, as produced by ndarray.tobytes()
+        encoding = np.frombuffer(encoding, dtype=np.float64)
+    vector = np.asarray(encoding, dtype=_DTYPE).reshape(FACE_DIM)
+    return _HEADER.pack(_VERSION, _DTYPE_CODES[_DTYPE]) + vector.tobytes()
+
+
+def is_current(blob):
+    return len(blob) == _BLOB_SIZE and blob[0] == _VERSION
+
+
+def decode_face(blob):
+    """Stored bytes (current or legacy pickled float64) -> float32 vector."""
+    if blob is None:
+        return None
+    blob = bytes(blob)
+    if is_current(blob):
+        return np.frombuffer(blob, dtype=_DTYPES[blob[1]], offset=_HEADER.size)
+    legacy = pickle.loads(blob)
+    if isinstance(legacy, (bytes, bytearray)):
+        legacy = np.frombuffer(legacy, dtype=np.float64)
+    return np.asarray(legacy, dtype=_DTYPE).reshape(FACE_DIM)
+
+
+def stack_faces(blobs):
+    """
+    Many stored embeddings -> one contiguous (N, 128) float32 matrix.
+
+    When every row is in the current format this is a single join and a
+    strided view, with no per-row numpy objects.
+    """
+    blobs = [bytes(b) for b in blobs]
+    if not blobs:
+        return np.empty((0, FACE_DIM), dtype=_DTYPE)
+    if all(is_current(b) for b in blobs):
+        raw = np.frombuffer(b''.join(blobs), dtype=np.uint8).reshape(len(blobs), _BLOB_SIZE)
+        return np.ascontiguousarray(raw[:, _HEADER.size:]).view(_DTYPE)
+    return np.vstack([decode_face(b) for b in blobs])
+
+
+class FaceEncoding(TypeDecorator):
+    """
+    128-d face embedding stored as 514 bytes: a version/dtype tag followed by
+    raw little-endian float32. Reads also accept legacy pickled float64 rows.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return encode_face(value)
+
+    def process_result_value(self, value, dialect):
+        return decode_face(value)
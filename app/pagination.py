@@ -0,0 +1,88 @@
+"""
+Keyset (cursor) pagination for the admin tables.
+
+A page is `ORDER BY sort_column, id LIMIT n` continued from the last row of
+the previous page with a row-value comparison, `(sort_column, id) > (v, i)`
+(or `<` when descending). The database seeks straight to the cursor through
+the index instead of counting past OFFSET rows, so page 1,000 costs the same
+as page 1.
+
+Cursors are opaque to clients: base64url JSON holding the sort key, the
+direction and the last row's (value, id).
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from app.extensions import db
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class BadCursor(ValueError):
+    pass
+
+
+def page_size(value, default=DEFAULT_PAGE_SIZE):
+    """Requested page size clamped to 1..MAX_PAGE_SIZE."""
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return default
+
+
+def encode_cursor(sort, order, value, row_id):
+    if isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    payload = json.dumps([sort, order, value, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, sort, order, column):
+    """(value, id) from a cursor issued for the same sort; raises BadCursor."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        c_sort, c_order, value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(row_id, int) or isinstance(row_id, bool):
+            raise ValueError("row id")
+        if value is not None and column.type.python_type is datetime:
+            if not isinstance(value, str):
+                raise ValueError("timestamp")
+            value = datetime.fromisoformat(value)
+        elif isinstance(value, (list, dict)):
+            raise ValueError("value")
+    except (binascii.Error, ValueError, TypeError):
+        raise BadCursor("Malformed cursor.")
+    if (c_sort, c_order) != (sort, order):
+        raise BadCursor("Cursor was issued for a different sort order.")
+    return value, row_id
+
+
+def keyset_page(query, sort, order, column, id_column, key, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    One page of `query` ordered by (column, id_column).
+
+    `sort` is the client-facing sort key (stored in cursors), `order` is
+    'asc' or 'desc', and `key(row)` returns a row's (column value, id).
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    `column` must not be NULL for rows that can be paged over.
+    """
+    descending = order == 'desc'
+    if cursor:
+        value, row_id = decode_cursor(cursor, sort, order, column)
+        position = db.tuple_(column, id_column)
+        query = query.filter(position < (value, row_id) if descending else position > (value, row_id))
+
+    if descending:
+        query = query.order_by(column.desc(), id_column.desc())
+    else:
+        query = query.order_by(column.asc(), id_column.asc())
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(sort, order, *key(rows[-1]))
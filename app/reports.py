@@ -0,0 +1,226 @@
+"""
+Attendance report jobs.
+
+An admin submits (field, course, start, end); a background thread renders
+the PDF and stores it under REPORTS_PATH as `<key>.pdf`, where the key
+hashes the parameters together with attendance.data_version() for them.
+Any attendance write in the range bumps that version, so a repeated
+request is served from disk until the underlying rows change, and then
+rendered afresh under a new key.
+
+Job state lives next to the artifact (`<key>.json`), so a status poll can
+be answered by whichever gunicorn worker receives it. Artifacts unused for
+REPORT_CACHE_DAYS are pruned.
+"""
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+from app import attendance
+from app.exports import export_query, iter_batches
+
+
+log = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, EMPTY, FAILED = 'queued', 'running', 'done', 'empty', 'failed'
+
+
+class ReportUnavailable(RuntimeError):
+    pass
+
+
+def report_key(params, version):
+    payload = json.dumps([params, version], sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def write_pdf(out, field=None, course=None, start=None, end=None):
+    """Render the attendance report to a binary file object; returns the row count."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas as pdf_canvas
+
+    pdf = pdf_canvas.Canvas(out, pagesize=letter)
+    width, height = letter
+
+    if start and start == end:
+        dates = start
+    elif start or end:
+        dates = f"{start or '...'} to {end or '...'}"
+    else:
+        dates = 'All Dates'
+
+    pdf.setTitle("Attendance Report")
+    pdf.setFont("Helvetica-Bold", 16)
+    pdf.drawString(180, height - 50, "Attendance Report")
+
+    pdf.setFont("Helvetica", 12)
+    pdf.drawString(50, height - 80, f"Field: {field or 'All'}")
+    pdf.drawString(250, height - 80, f"Course: {course or 'All'}")
+    pdf.drawString(450, height - 80, f"Date: {dates}")
+
+    y = height - 120
+    pdf.setFont("Helvetica-Bold", 12)
+    pdf.drawString(50, y, "Student")
+    pdf.drawString(220, y, "Roll")
+    pdf.drawString(320, y, "Field")
+    pdf.drawString(400, y, "Course")
+    pdf.drawString(480, y, "Date")
+    pdf.drawString(550, y, "Status")
+
+    pdf.setFont("Helvetica", 10)
+    y -= 18
+
+    rows = 0
+    for batch in iter_batches(export_query(field, course, start, end)):
+        for username, roll, rec_field, rec_course, stamp, status in batch:
+            pdf.drawString(50, y, str(username))
+            pdf.drawString(220, y, str(roll))
+            pdf.drawString(320, y, str(rec_field))
+            pdf.drawString(400, y, str(rec_course))
+            pdf.drawString(480, y, stamp.strftime("%Y-%m-%d %H:%M"))
+            pdf.drawString(550, y, str(status))
+            rows += 1
+            y -= 15
+            if y < 60:
+                pdf.showPage()
+                y = height - 50
+                pdf.setFont("Helvetica", 10)
+
+    pdf.save()
+    return rows
+
+
+class ReportQueue:
+    def __init__(self, workers=1, cache_days=7, stale_after=900):
+        self.workers = workers
+        self.cache_days = cache_days
+        self.stale_after = stale_after  # a queued/running marker older than this is abandoned
+        self.path = None
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def configure(self, path, workers=None, cache_days=None):
+        self.path = Path(path)
+        if workers is not None:
+            self.workers = workers
+        if cache_days is not None:
+            self.cache_days = cache_days
+
+    # -- public API -------------------------------------------------------
+    def submit(self, app, field=None, course=None, start=None, end=None):
+        """
+        Status dict for the report with these parameters, queueing a render
+        unless a current artifact or an in-flight job already exists.
+        Needs an app context (reads the data version).
+        """
+        try:
+            import reportlab  # noqa: F401
+        except ImportError:
+            raise ReportUnavailable("PDF export not available (missing 'reportlab').")
+
+        params = {'field': field or None, 'course': course or None, 'start': start or None, 'end': end or None}
+        key = report_key(params, attendance.data_version(**params))
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        state = self.status(key)
+        if state and state['status'] in (DONE, EMPTY, QUEUED, RUNNING):
+            if state['status'] == DONE:
+                os.utime(self._artifact(key))  # keep recently used artifacts
+            return state
+
+        self._prune()
+        state = self._write_state(key, QUEUED, params=params)
+        self._ensure_started()
+        self._queue.put((app, key, params))
+        return state
+
+    def status(self, key):
+        """Latest state of a report key, or None if it is unknown here."""
+        if not _is_key(key):
+            return None
+        if self._artifact(key).exists():
+            state = self._read_state(key) or {'id': key}
+            return dict(state, status=DONE)
+        state = self._read_state(key)
+        if state and state['status'] in (QUEUED, RUNNING) and time.time() - state['updated_at'] > self.stale_after:
+            return None
+        return state
+
+    def artifact(self, key):
+        """Path of a rendered report, or None."""
+        if not _is_key(key):
+            return None
+        path = self._artifact(key)
+        return path if path.exists() else None
+
+    # -- internals --------------------------------------------------------
+    def _artifact(self, key):
+        return self.path / f"{key}.pdf"
+
+    def _read_state(self, key):
+        try:
+            return json.loads((self.path / f"{key}.json").read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_state(self, key, status, **extra):
+        state = dict(self._read_state(key) or {}, id=key, status=status, updated_at=time.time(), **extra)
+        tmp = self.path / f"{key}.json.{os.getpid()}.{threading.get_ident()}"
+        tmp.write_text(json.dumps(state))
+        os.replace(tmp, self.path / f"{key}.json")
+        return state
+
+    def _prune(self):
+        cutoff = time.time() - self.cache_days * 86400
+        for entry in self.path.iterdir():
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    entry.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _ensure_started(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                t = threading.Thread(target=self._run, name=f"report-worker-{len(self._threads)}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _run(self):
+        while True:
+            app, key, params = self._queue.get()
+            self._render(app, key, params)
+
+    def _render(self, app, key, params):
+        self._write_state(key, RUNNING)
+        start = time.perf_counter()
+        tmp = self.path / f"{key}.pdf.{os.getpid()}.part"
+        try:
+            with app.app_context():
+                with open(tmp, 'wb') as out:
+                    rows = write_pdf(out, **params)
+            if not rows:
+                tmp.unlink()
+                self._write_state(key, EMPTY, rows=0,
+                                  message="No attendance data found for the selected criteria.")
+                return
+            os.replace(tmp, self._artifact(key))
+            self._write_state(key, DONE, rows=rows, seconds=round(time.perf_counter() - start, 3))
+        except Exception as e:
+            log.error(f"Report {key} failed: {e}")
+            tmp.unlink(missing_ok=True)
+            self._write_state(key, FAILED, message=str(e))
+
+
+def _is_key(key):
+    return len(key) == 40 and all(c in '0123456789abcdef' for c in key)
+
+
+reports = ReportQueue()
@@ -1,16 +1,25 @@
 from flask import (
     Blueprint, render_template, send_file, request, redirect, url_for,
-    session, flash, jsonify, current_app, make_response
+    session, flash, jsonify, current_app, make_response, Response, stream_with_context
 )
 from functools import wraps
 from datetime import datetime
 from datetime import date as dt_date
 import os
-from io import BytesIO
-import cloudinary
-import cloudinary.uploader
+from app import storage
+from app.attendance import (
+    day_summary, insert_new, on_day, parse_day, presence, recount, recount_students, student_counts,
+    student_keys, tally
+)
+from app.cohorts import catalog, enrol
+from app.exports import FORMATS, export_query, iter_batches
 from app.extensions import db
-from app.models.models import User, Admin, Attendance
+from app.live import hub
+from app.models.models import User, Admin, Attendance, StudentAttendanceStats, USER_LISTING
+from app.pagination import BadCursor, keyset_page, page_size
+from app.reports import ReportUnavailable, reports
+from app.vision.ann import campus_index
+from app.vision.gallery import gallery
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -30,6 +39,131 @@ def admin_required(f):
     return decorated_function
 
 
+# Paged listings: sort key -> (column, that column's value on a row). Pages
+# are ordered by (column, id) and continued with a keyset cursor, see
+# app/pagination.py.
+ATTENDANCE_SORTS = {
+    'date': (Attendance.date, lambda r: r.date),
+    'name': (User.username, lambda r: r.student.username),
+    'roll': (User.roll, lambda r: r.student.roll),
+    'status': (Attendance.status, lambda r: r.status),
+}
+STUDENT_SORTS = {
+    'roll': (User.roll, lambda s: s.roll),
+    'name': (User.username, lambda s: s.username),
+    'created': (User.created_at, lambda s: s.created_at),
+}
+
+
+def _sort_args(params, sorts, default_sort, default_order):
+    sort = params.get('sort') if params.get('sort') in sorts else default_sort
+    order = params.get('order') if params.get('order') in ('asc', 'desc') else default_order
+    return sort, order
+
+
+def _student_search(q):
+    """Name contains `q`, or an exact roll number when `q` is numeric."""
+    match = User.username.icontains(q, autoescape=True)
+    if q.isdigit():
+        match = db.or_(match, User.roll == int(q))
+    return match
+
+
+def _attendance_page(params):
+    """One page of attendance rows (with their students) for the admin filters."""
+    sort, order = _sort_args(params, ATTENDANCE_SORTS, 'date', 'desc')
+    column, value_of = ATTENDANCE_SORTS[sort]
+
+    query = db.session.query(Attendance).join(Attendance.student).options(
+        db.contains_eager(Attendance.student).options(USER_LISTING)
+    )
+    if params.get('field'):
+        query = query.filter(User.field == params['field'])
+    if params.get('course'):
+        query = query.filter(User.course == params['course'])
+    if params.get('student'):
+        query = query.filter(Attendance.student_id == params['student'])
+    if parse_day(params.get('date')):
+        query = query.filter(on_day(Attendance.date, params['date']))
+    if params.get('status'):
+        query = query.filter(Attendance.status == params['status'])
+    q = (params.get('q') or '').strip()
+    if q:
+        query = query.filter(_student_search(q))
+
+    return keyset_page(
+        query, sort, order, column, Attendance.id,
+        key=lambda r: (value_of(r), r.id),
+        cursor=params.get('cursor'), limit=page_size(params.get('limit'))
+    )
+
+
+def _students_page(params):
+    """One page of registered students for the admin filters."""
+    sort, order = _sort_args(params, STUDENT_SORTS, 'roll', 'asc')
+    column, value_of = STUDENT_SORTS[sort]
+
+    query = db.session.query(User).options(USER_LISTING)
+    if params.get('field'):
+        query = query.filter(User.field == params['field'])
+    if params.get('course'):
+        query = query.filter(User.course == params['course'])
+    if parse_day(params.get('date')):
+        query = query.filter(on_day(User.created_at, params['date']))
+    q = (params.get('q') or '').strip()
+    if q:
+        query = query.filter(_student_search(q))
+
+    return keyset_page(
+        query, sort, order, column, User.id,
+        key=lambda s: (value_of(s), s.id),
+        cursor=params.get('cursor'), limit=page_size(params.get('limit'))
+    )
+
+
+def _day_range(params):
+    """(start, end) 'YYYY-MM-DD' days from `date` or `start`/`end`; None when open or invalid."""
+    def day(name):
+        value = parse_day(params.get(name) or params.get('date'))
+        return value.isoformat() if value else None
+    return day('start'), day('end')
+
+
+def _range_label(start, end):
+    if not (start or end):
+        return 'all'
+    return start if start == end else f"{start or 'start'}_{end or 'now'}"
+
+
+def _attendance_json(record):
+    return {
+        'id': record.id,
+        'student_id': record.student_id,
+        'username': record.student.username,
+        'roll': record.student.roll,
+        'field': record.student.field,
+        'course': record.student.course,
+        'date': record.date.isoformat(),
+        'date_display': record.date.strftime('%Y-%m-%d %H:%M'),
+        'status': record.status,
+    }
+
+
+def _student_json(student):
+    local_time = current_app.jinja_env.filters['format_local_time']
+    return {
+        'id': student.id,
+        'username': student.username,
+        'email': student.email,
+        'roll': student.roll,
+        'field': student.field,
+        'course': student.course,
+        'image_path': student.image_path,
+        'created_at': student.created_at.isoformat() if student.created_at else None,
+        'created_display': local_time(student.created_at) if student.created_at else 'N/A',
+    }
+
+
 @admin_bp.route('/', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -78,19 +212,16 @@ def manage_students():
     selected_course = request.form.get('course') if request.method == 'POST' else ''
     selected_date = request.form.get('date') if request.method == 'POST' else dt_date.today().strftime('%Y-%m-%d')
 
-    fields = [f[0] for f in db.session.query(User.field).distinct().all()]
-    if selected_field:
-        courses = [c[0] for c in db.session.query(User.course).filter_by(field=selected_field).distinct().all()]
-    else:
-        courses = [c[0] for c in db.session.query(User.course).distinct().all()]
+    fields = catalog.fields()
+    courses = catalog.courses(selected_field)
 
-    query = db.session.query(User)
+    query = db.session.query(User).options(USER_LISTING)
     if selected_field:
         query = query.filter_by(field=selected_field)
     if selected_course:
         query = query.filter_by(course=selected_course)
-    if selected_date:
-        query = query.filter(db.func.date(User.created_at) == selected_date)
+    if parse_day(selected_date):
+        query = query.filter(on_day(User.created_at, selected_date))
 
     students = query.order_by(User.roll.asc()).all()
 
@@ -117,7 +248,9 @@ def add_student():
         course = request.form.get('course')
         new_student = User(username=username, email=email, roll=roll, field=field, course=course)
         db.session.add(new_student)
+        enrol([(field, course, 1)])
         db.session.commit()
+        catalog.invalidate()
         flash("Student added!", "success")
         return redirect(url_for('admin.manage_students'))
     return render_template('admin/add_student.html')
@@ -131,6 +264,9 @@ def edit_student(user_id):
         return redirect(url_for('admin.manage_students'))
 
     if request.method == 'POST':
+        old_cohort = (student.field, student.course)
+        # name, roll and cohort show up in reports and rollups for the student's history
+        history = student_keys(student.id)
         student.username = request.form.get('username')
         student.email = request.form.get('email')
         student.roll = request.form.get('roll')
@@ -140,7 +276,7 @@ def edit_student(user_id):
         # ✅ Cloudinary Upload
         photo = request.files.get('photo')
         if photo and photo.filename:
-            upload_result = cloudinary.uploader.upload(
+            upload_result = storage.upload(
                 photo,
                 folder="attendance/faces",
                 public_id=f"{student.username}-{student.roll}",
@@ -148,7 +284,12 @@ def edit_student(user_id):
             )
             student.image_path = upload_result.get("secure_url")  # save cloud URL
 
+        db.session.flush()
+        recount(history + student_keys(student.id))
+        enrol([(*old_cohort, -1), (student.field, student.course, 1)])
         db.session.commit()
+        catalog.invalidate()
+        gallery.invalidate(old_cohort, (student.field, student.course))
         flash("Student updated!", "success")
         return redirect(url_for('admin.manage_students'))
 
@@ -161,9 +302,20 @@ def delete_student(user_id):
     student = db.session.get(User, user_id)
     if not student:
         return redirect(url_for('admin.manage_students'))
+    history = student_keys(student.id)
+    db.session.query(StudentAttendanceStats).filter_by(student_id=student.id).delete()
     db.session.query(Attendance).filter_by(student_id=student.id).delete()
+    cohort = (student.field, student.course)
     db.session.delete(student)
+    recount(history)
+    enrol([(*cohort, -1)])
     db.session.commit()
+    catalog.invalidate()
+    gallery.invalidate(cohort)
+    try:
+        campus_index.remove(user_id)
+    except Exception as e:
+        current_app.logger.error(f"Face index update failed: {e}")
     flash("Student and their attendance deleted!", "danger")
     return redirect(url_for('admin.manage_students'))
 
@@ -171,48 +323,37 @@ def delete_student(user_id):
 @admin_bp.route('/attendance-viewer', methods=['GET', 'POST'])
 @admin_required
 def attendance_viewer():
-    fields = [f[0] for f in db.session.query(User.field).distinct().all()]
     selected_field = request.form.get('field') if request.method == 'POST' else ''
     selected_course = request.form.get('course') if request.method == 'POST' else ''
     selected_student = request.form.get('student') if request.method == 'POST' else ''
     selected_date = request.form.get('date') if request.method == 'POST' else ''
 
-    if selected_field:
-        courses = [c[0] for c in db.session.query(User.course).filter_by(field=selected_field).distinct().all()]
-    else:
-        courses = [c[0] for c in db.session.query(User.course).distinct().all()]
+    fields = catalog.fields()
+    courses = catalog.courses(selected_field)
 
-    students_query = db.session.query(User)
+    students_query = db.session.query(User).options(db.load_only(User.id, User.username))
     if selected_field:
         students_query = students_query.filter_by(field=selected_field)
     if selected_course:
         students_query = students_query.filter_by(course=selected_course)
     students = students_query.all()
 
-    attendance_records = db.session.query(Attendance)
-    if selected_field or selected_course:
-        attendance_records = attendance_records.join(User)
-    if selected_field:
-        attendance_records = attendance_records.filter(User.field == selected_field)
-    if selected_course:
-        attendance_records = attendance_records.filter(User.course == selected_course)
-    if selected_student:
-        attendance_records = attendance_records.filter(Attendance.student_id == selected_student)
-    if selected_date:
-        try:
-            date_obj = datetime.strptime(selected_date, "%Y-%m-%d")
-            attendance_records = attendance_records.filter(db.func.date(Attendance.date) == date_obj.date())
-        except Exception:
-            pass
-
-    attendance_records = attendance_records.all()
+    # first page only; "Load more" continues through /admin/api/attendance
+    params = request.form if request.method == 'POST' else {}
+    attendance_records, next_cursor = _attendance_page(params)
+    sort, order = _sort_args(params, ATTENDANCE_SORTS, 'date', 'desc')
 
     return render_template(
         'admin/attendance_viewer.html',
         attendance_records=attendance_records,
+        next_cursor=next_cursor,
+        search=params.get('q', ''),
+        sort=sort,
+        order=order,
         students=students,
         fields=fields,
         courses=courses,
+        course_map=catalog.course_map(),
         selected_student=selected_student,
         selected_field=selected_field,
         selected_course=selected_course,
@@ -223,78 +364,60 @@ def attendance_viewer():
 @admin_bp.route('/export_attendance/pdf')
 @admin_required
 def export_attendance_pdf():
-    # Import lazily so lack of dependency won't crash the app
+    """Cached report if it is current; otherwise queue it (see /admin/reports)."""
+    start, end = _day_range(request.args)
     try:
-        from reportlab.lib.pagesizes import letter
-        from reportlab.pdfgen import canvas as pdf_canvas
-    except Exception:
-        return "PDF export not available (missing 'reportlab').", 501
+        state = reports.submit(current_app._get_current_object(), request.args.get('field'),
+                               request.args.get('course'), start, end)
+    except ReportUnavailable as e:
+        return str(e), 501
+
+    if state['status'] == 'done':
+        return _send_report(state)
+    if state['status'] == 'empty':
+        return state['message'], 404
+    response = make_response("The report is being generated, try again in a few seconds.", 202)
+    response.headers['Retry-After'] = '5'
+    return response
 
-    field = request.args.get('field')
-    course = request.args.get('course')
-    date_str = request.args.get('date')
 
-    records_q = db.session.query(Attendance).join(User)
-    if field:
-        records_q = records_q.filter(User.field == field)
-    if course:
-        records_q = records_q.filter(User.course == course)
-    if date_str:
-        try:
-            date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
-            records_q = records_q.filter(db.func.date(Attendance.date) == date_obj)
-        except Exception:
-            pass
-
-    records = records_q.order_by(Attendance.date.asc()).all()
-    if not records:
-        return "No attendance data found for the selected criteria.", 404
-
-    buffer = BytesIO()
-    pdf = pdf_canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-
-    pdf.setTitle("Attendance Report")
-    pdf.setFont("Helvetica-Bold", 16)
-    pdf.drawString(180, height - 50, "Attendance Report")
-
-    pdf.setFont("Helvetica", 12)
-    pdf.drawString(50, height - 80, f"Field: {field or 'All'}")
-    pdf.drawString(250, height - 80, f"Course: {course or 'All'}")
-    pdf.drawString(450, height - 80, f"Date: {date_str or 'All Dates'}")
-
-    y = height - 120
-    pdf.setFont("Helvetica-Bold", 12)
-    pdf.drawString(50, y, "Student")
-    pdf.drawString(220, y, "Roll")
-    pdf.drawString(320, y, "Field")
-    pdf.drawString(400, y, "Course")
-    pdf.drawString(480, y, "Date")
-    pdf.drawString(550, y, "Status")
-
-    pdf.setFont("Helvetica", 10)
-    y -= 18
-
-    for rec in records:
-        if rec.student:
-            pdf.drawString(50, y, str(rec.student.username))
-            pdf.drawString(220, y, str(rec.student.roll))
-            pdf.drawString(320, y, str(rec.student.field))
-            pdf.drawString(400, y, str(rec.student.course))
-            pdf.drawString(480, y, rec.date.strftime("%Y-%m-%d %H:%M"))
-            pdf.drawString(550, y, str(rec.status))
-            y -= 15
-            if y < 60:
-                pdf.showPage()
-                y = height - 50
-                pdf.setFont("Helvetica", 10)
-
-    pdf.save()
-    buffer.seek(0)
+@admin_bp.route('/reports', methods=['POST'])
+@admin_required
+def submit_report():
+    """Queue a PDF report for field, course and date or start/end; returns its status."""
+    start, end = _day_range(request.form)
+    try:
+        state = reports.submit(current_app._get_current_object(), request.form.get('field'),
+                               request.form.get('course'), start, end)
+    except ReportUnavailable as e:
+        return jsonify({'success': False, 'message': str(e)}), 501
+    return jsonify(dict(state, success=True))
+
+
+@admin_bp.route('/reports/<report_id>')
+@admin_required
+def report_status(report_id):
+    state = reports.status(report_id)
+    if not state:
+        return jsonify({'success': False, 'message': 'Unknown report.'}), 404
+    return jsonify(dict(state, success=True))
+
+
+@admin_bp.route('/reports/<report_id>/download')
+@admin_required
+def download_report(report_id):
+    state = reports.status(report_id)
+    if not state or state['status'] != 'done':
+        return "Report not found.", 404
+    return _send_report(state)
+
+
+def _send_report(state):
+    params = state.get('params') or {}
     return send_file(
-        buffer,
+        reports.artifact(state['id']),
         as_attachment=True,
-        download_name=f"attendance_report_{date_str or 'all'}.pdf",
+        download_name=f"attendance_report_{_range_label(params.get('start'), params.get('end'))}.pdf",
         mimetype='application/pdf'
     )
 
@@ -302,28 +425,22 @@ def export_attendance_pdf():
 @admin_bp.route('/registered-students', methods=['GET', 'POST'])
 @admin_required
 def registered_students():
-    fields = [f[0] for f in db.session.query(User.field).distinct().all()]
     selected_field = request.form.get('field') if request.method == 'POST' else ''
     selected_course = request.form.get('course') if request.method == 'POST' else ''
     selected_date = request.form.get('date') if request.method == 'POST' else dt_date.today().strftime('%Y-%m-%d')
 
-    if selected_field:
-        courses = [c[0] for c in db.session.query(User.course).filter_by(field=selected_field).distinct().all()]
-    else:
-        courses = [c[0] for c in db.session.query(User.course).distinct().all()]
+    fields = catalog.fields()
+    courses = catalog.courses(selected_field)
 
-    students_query = db.session.query(User)
-    if selected_field:
-        students_query = students_query.filter_by(field=selected_field)
-    if selected_course:
-        students_query = students_query.filter_by(course=selected_course)
-    if selected_date:
-        students_query = students_query.filter(db.func.date(User.created_at) == selected_date)
-    students = students_query.all()
+    # first page only; "Load more" continues through /admin/api/students
+    params = request.form if request.method == 'POST' else {'date': selected_date}
+    students, next_cursor = _students_page(params)
 
     return render_template(
         'admin/registered_students.html',
         students=students,
+        next_cursor=next_cursor,
+        search=params.get('q', ''),
         fields=fields,
         courses=courses,
         selected_field=selected_field,
@@ -333,90 +450,183 @@ def registered_students():
     )
 
 
-@admin_bp.route('/export-attendance/<format>')
+@admin_bp.errorhandler(BadCursor)
+def bad_cursor(e):
+    return jsonify({'success': False, 'message': str(e)}), 400
+
+
+@admin_bp.route('/api/attendance')
 @admin_required
-def export_attendance(format):
-    import io, csv
-    from flask import Response
+def attendance_api():
+    """
+    Attendance rows for the admin tables, a page at a time.
+    Filters: field, course, student, date, status, q (name or roll);
+    sort: date|name|roll|status, order: asc|desc; limit; cursor.
+    """
+    records, next_cursor = _attendance_page(request.args)
+    return jsonify({
+        'success': True,
+        'items': [_attendance_json(r) for r in records],
+        'next_cursor': next_cursor,
+    })
+
+
+@admin_bp.route('/api/students')
+@admin_required
+def students_api():
+    """
+    Registered students, a page at a time.
+    Filters: field, course, date (registration day), q (name or roll);
+    sort: roll|name|created, order: asc|desc; limit; cursor.
+    """
+    students, next_cursor = _students_page(request.args)
+    return jsonify({
+        'success': True,
+        'items': [_student_json(s) for s in students],
+        'next_cursor': next_cursor,
+    })
+
+
+def _rate(counts):
+    attended = counts['present'] + counts['late']
+    return round(100.0 * attended / counts['total'], 1) if counts['total'] else None
+
+
+def _stats_json(stats):
+    """Counters of a StudentAttendanceStats row (or a row selecting its columns)."""
+    counts = {name: getattr(stats, name) or 0 for name in ('total', 'present', 'late', 'absent')}
+    return dict(
+        counts,
+        rate=_rate(counts),
+        streak=stats.streak or 0,
+        last_seen=stats.last_seen.isoformat() if stats.last_seen else None,
+    )
 
-    date_str = request.args.get('date')
-    field = request.args.get('field')
-    course = request.args.get('course')
 
-    query = db.session.query(Attendance).join(User)
-    if date_str:
-        try:
-            date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
-            query = query.filter(db.func.date(Attendance.date) == date_obj)
-        except ValueError:
-            pass
-    if field:
-        query = query.filter(User.field == field)
-    if course:
-        query = query.filter(User.course == course)
-
-    attendance_records = query.all()
-
-    if format == 'csv':
-        si = io.StringIO()
-        cw = csv.writer(si)
-        cw.writerow(['Student', 'Roll', 'Field', 'Course', 'Date', 'Status'])
-        for r in attendance_records:
-            if r.student:
-                cw.writerow([
-                    r.student.username,
-                    r.student.roll,
-                    r.student.field,
-                    r.student.course,
-                    r.date.strftime('%Y-%m-%d %H:%M'),
-                    r.status
-                ])
-        output = si.getvalue()
-        return Response(
-            output,
-            mimetype="text/csv",
-            headers={"Content-Disposition": f"attachment;filename=attendance_{date_str or 'all'}.csv"}
-        )
-    else:
+@admin_bp.route('/api/students/<int:student_id>/stats')
+@admin_required
+def student_stats_api(student_id):
+    """
+    Attendance counters for one student (kept up to date on every write).
+    With start and/or end, also counts for that range of days, e.g. a term.
+    """
+    student = db.session.query(User).options(
+        db.load_only(User.id, User.username, User.roll, User.field, User.course)
+    ).filter(User.id == student_id).first()
+    if not student:
+        return jsonify({'success': False, 'message': 'Unknown student.'}), 404
+    stats = db.session.get(StudentAttendanceStats, student_id) or StudentAttendanceStats()
+
+    body = {
+        'success': True,
+        'student_id': student.id,
+        'username': student.username,
+        'roll': student.roll,
+        'field': student.field,
+        'course': student.course,
+        'stats': _stats_json(stats),
+    }
+    start, end = request.args.get('start'), request.args.get('end')
+    if parse_day(start) or parse_day(end):
+        counts = student_counts(student_id, start, end)
+        body['range'] = dict(counts, start=start, end=end, rate=_rate(counts))
+    return jsonify(body)
+
+
+@admin_bp.route('/api/stats')
+@admin_required
+def cohort_stats_api():
+    """Attendance counters for every student of a cohort (field, course, optional roll), by roll."""
+    Stats = StudentAttendanceStats
+    rows = db.session.query(
+        User.id, User.username, User.roll, User.field, User.course,
+        Stats.total, Stats.present, Stats.late, Stats.absent, Stats.streak, Stats.last_seen
+    ).outerjoin(Stats, Stats.student_id == User.id)
+    if request.args.get('field'):
+        rows = rows.filter(User.field == request.args['field'])
+    if request.args.get('course'):
+        rows = rows.filter(User.course == request.args['course'])
+    if request.args.get('roll', '').isdigit():
+        rows = rows.filter(User.roll == int(request.args['roll']))
+
+    return jsonify({
+        'success': True,
+        'items': [
+            dict(_stats_json(row), student_id=row.id, username=row.username,
+                 roll=row.roll, field=row.field, course=row.course)
+            for row in rows.order_by(User.roll.asc(), User.id.asc())
+        ],
+    })
+
+
+@admin_bp.route('/export-attendance/<format>')
+@admin_required
+def export_attendance(format):
+    """
+    Stream attendance as csv, ndjson or parquet (needs pyarrow).
+    Filters: field, course, and either date (one day) or start/end.
+    """
+    if format not in FORMATS:
         return "Invalid format", 400
+    if format == 'parquet':
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            return "Parquet export not available (missing 'pyarrow').", 501
+
+    start, end = _day_range(request.args)
+    stmt = export_query(request.args.get('field'), request.args.get('course'), start, end)
+
+    mimetype, encode = FORMATS[format]
+    return Response(
+        stream_with_context(encode(iter_batches(stmt))),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment;filename=attendance_{_range_label(start, end)}.{format}"}
+    )
 
 
 @admin_bp.route('/manage-attendance', methods=['GET', 'POST'])
 @admin_required
 def manage_attendance():
-    fields = db.session.query(User.field).distinct().all()
     selected_field = request.form.get('field') if request.method == 'POST' else ''
     selected_course = request.form.get('course') if request.method == 'POST' else ''
     selected_date = request.form.get('date') if request.method == 'POST' else dt_date.today().strftime('%Y-%m-%d')
 
-    if selected_field:
-        courses = db.session.query(User.course).filter_by(field=selected_field).distinct().all()
-    else:
-        courses = db.session.query(User.course).distinct().all()
+    fields = catalog.fields()
+    courses = catalog.courses(selected_field)
 
-    students_query = db.session.query(User)
-    if selected_field:
-        students_query = students_query.filter_by(field=selected_field)
-    if selected_course:
-        students_query = students_query.filter_by(course=selected_course)
-    students = students_query.all()
+    # one page of the roster (by roll) at a time; "Next page" posts the cursor
+    day = parse_day(selected_date) or dt_date.today()
+    students, next_cursor = _students_page({
+        'field': selected_field, 'course': selected_course,
+        'cursor': request.form.get('cursor'), 'limit': request.form.get('limit'),
+    })
 
     attendance_records = db.session.query(Attendance).filter(
         Attendance.student_id.in_([s.id for s in students]),
-        db.func.date(Attendance.date) == selected_date
+        on_day(Attendance.date, day)
     ).all()
     attendance_dict = {r.student_id: r for r in attendance_records}
 
-    present_count = sum(1 for r in attendance_records if r.status == '✅Present')
-    late_count = sum(1 for r in attendance_records if r.status == '⏰Present-Late')
-    absent_count = len(students) - present_count - late_count
+    # totals cover the whole cohort, not just this page, and come from the
+    # cohort catalog and the daily rollup rather than the day's rows
+    total_students = catalog.students(selected_field, selected_course)
+    counts = day_summary(selected_field, selected_course, day)
+
+    present_count = counts['present']
+    late_count = counts['late']
+    absent_count = total_students - present_count - late_count
 
     return render_template(
         'admin/manage_attendance.html',
         students=students,
+        next_cursor=next_cursor,
+        paged=bool(request.form.get('cursor')),
+        total_students=total_students,
         attendance_dict=attendance_dict,
         fields=fields,
         courses=courses,
+        course_map=catalog.course_map(),
         selected_field=selected_field,
         selected_course=selected_course,
         selected_date=selected_date,
@@ -430,21 +640,25 @@ def manage_attendance():
 @admin_bp.route('/attendance/add', methods=['POST'])
 @admin_required
 def add_attendance():
-    student_id = request.form.get('student_id')
+    try:
+        student_id = int(request.form.get('student_id', ''))
+        date_obj = datetime.strptime(request.form.get('date', ''), "%Y-%m-%d")
+    except ValueError:
+        return jsonify({'success': False, 'message': 'A numeric student_id and a YYYY-MM-DD date are required'}), 400
     status = request.form.get('status')
     field = request.form.get('field')
     course = request.form.get('course')
-    date_str = request.form.get('date')
-    date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-    new_record = Attendance(
-        student_id=student_id,
-        date=date_obj,
-        status=status,
-        field=field,
-        course=course
-    )
-    db.session.add(new_record)
+    # ON CONFLICT DO NOTHING: the unique daily index allows one row per day
+    if not insert_new([{
+        'student_id': student_id, 'date': date_obj, 'status': status, 'field': field, 'course': course,
+    }]):
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Attendance already marked for this day'}), 409
+    tally((*key, status, 1) for key in student_keys(student_id, date_obj.date()))
+    recount_students([student_id])
     db.session.commit()
+    presence.add([student_id], field, course, date_obj.date())
+    hub.publish(field, course, date_obj.date(), [(student_id, status, date_obj)])
     return jsonify({'success': True})
 
 
@@ -455,8 +669,13 @@ def save_attendance():
     status = request.form.get('status')
     record = db.session.get(Attendance, record_id)
     if record:
+        keys = student_keys(record.student_id, record.date.date())
+        tally([(*key, record.status, -1) for key in keys] + [(*key, status, 1) for key in keys])
         record.status = status
+        db.session.flush()
+        recount_students([record.student_id])
         db.session.commit()
+        hub.publish(record.field, record.course, record.date.date(), [(record.student_id, status, record.date)])
         return jsonify({'success': True})
     return jsonify({'success': False})
 
@@ -467,8 +686,14 @@ def delete_attendance():
     record_id = request.form.get('record_id')
     record = db.session.get(Attendance, record_id)
     if record:
+        marked = (record.student_id, record.field, record.course, record.date.date())
+        tally((*key, record.status, -1) for key in student_keys(record.student_id, record.date.date()))
         db.session.delete(record)
+        db.session.flush()
+        recount_students([record.student_id])
         db.session.commit()
+        presence.discard(*marked)
+        hub.publish(*marked[1:], [(marked[0], None, None)])
         return jsonify({'success': True})
     return jsonify({'success': False})
 
@@ -482,25 +707,15 @@ def custom_email_page():
 @admin_bp.route('/send-custom-email', methods=['POST'])
 @admin_required
 def send_custom_email():
-    from config import EMAIL_SENDER, EMAIL_PASSWORD, SMTP_SERVER, SMTP_PORT
-    import smtplib
-    from email.mime.text import MIMEText
+    from app.mail import outbox, build_message
 
     email = request.form.get('email')
     subject = request.form.get('subject')
     message = request.form.get('message')
 
-    msg = MIMEText(message)
-    msg['Subject'] = subject
-    msg['From'] = EMAIL_SENDER
-    msg['To'] = email
-
     try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(EMAIL_SENDER, EMAIL_PASSWORD)
-            server.sendmail(EMAIL_SENDER, [email], msg.as_string())
-        flash('Email sent successfully!', 'success')
+        outbox.enqueue([build_message(email, subject, message)], label='custom')
+        flash('Email queued for delivery!', 'success')
     except Exception as e:
         flash(f'Failed to send email: {e}', 'danger')
 
@@ -510,7 +725,7 @@ def send_custom_email():
 @admin_bp.route('/send-absent-emails', methods=['POST'])
 @admin_required
 def send_absent_emails():
-    from app import send_absent_email
+    from app.mail import send_absent_emails as queue_absent_emails
 
     date_str = request.form.get('date')
     field = request.form.get('field')
@@ -518,22 +733,28 @@ def send_absent_emails():
     if not date_str:
         date_str = dt_date.today().strftime('%Y-%m-%d')
 
-    absentees = db.session.query(Attendance).join(User).filter(
+    absentees = db.session.query(User.email, User.username).join(
+        Attendance, Attendance.student_id == User.id
+    ).filter(
         Attendance.status == '❌Absent',
-        db.func.date(Attendance.date) == date_str
+        on_day(Attendance.date, parse_day(date_str) or dt_date.today())
     )
     if field:
         absentees = absentees.filter(User.field == field)
     if course:
         absentees = absentees.filter(User.course == course)
 
-    absentees = absentees.all()
-    count = 0
-    for record in absentees:
-        try:
-            send_absent_email(record.student.email, record.student.username, date_str)
-            count += 1
-        except Exception as e:
-            current_app.logger.error(f"Failed to send absent email to {record.student.email}: {e}")
+    job = queue_absent_emails(absentees.all(), date_str)
+    return jsonify({'success': True, 'count': job.total, 'job_id': job.id})
 
-    return jsonify({'success': True, 'count': count})
+
+@admin_bp.route('/email-jobs/<job_id>')
+@admin_required
+def email_job_status(job_id):
+    from app.mail import outbox
+
+    # Jobs live in the worker process that queued them
+    job = outbox.job(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': 'Unknown email job.'}), 404
+    return jsonify(dict(job.as_dict(), success=True))
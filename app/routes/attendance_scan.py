@@ -1,101 +1,403 @@
-from flask import Blueprint, request, jsonify
-from datetime import datetime
-import base64
-import re
-from io import BytesIO
+from flask import Blueprint, request, jsonify, current_app, stream_with_context
+from collections import OrderedDict
+import json
+import threading
+import time
 
 import numpy as np
-from PIL import Image
-import cv2
-import face_recognition
 
+from app import attendance, config
 from app.extensions import db
-from app.models.models import User, Attendance
+from app.models.models import User
+from app.vision import matching
+from app.vision.ann import campus_index
+from app.vision.detection import detect_faces
+from app.vision.encoder import encoder, EncoderBusy
+from app.vision.gallery import gallery
+from app.vision.imaging import BadImage, decode_image, read_request_image, request_params
+from app.vision.timing import StageTimer
+from app.vision.tracking import FaceTracker
 
 attendance_bp = Blueprint('attendance_bp', __name__)
 
+
+class IdempotencyCache:
+    """
+    Recent /scan-and-mark answers by (idempotency key, field, course).
+
+    Entries live in one worker's memory, so a retry that another gunicorn
+    worker receives misses them and runs recognition again. What keeps such
+    a retry from marking twice is the unique (student, field, course, day)
+    attendance index: the second insert finds the row and the answer is
+    `already_marked`. The cache only saves the repeated work.
+    """
+
+    def __init__(self, ttl=600, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_idempotent_responses = IdempotencyCache()
+
+
 @attendance_bp.route('/scan-face', methods=['POST'])
 def scan_face():
-    data = request.get_json()
+    timer = StageTimer()
+    result, code = _identify(request_params(request), timer)
+    result['timings'] = timer.as_dict()
+    current_app.logger.debug(f"scan-face timings: {timer.header()}")
+    return timer.apply(jsonify(result)), code
 
-    field = data.get('field')
-    course = data.get('course')
 
-    image_data = re.sub(r'^data:image/.+;base64,', '', data.get('image', ''))
-    try:
-        img_bytes = base64.b64decode(image_data)
-    except Exception:
-        return jsonify({'status': 'bad-image'}), 400
+@attendance_bp.route('/scan-and-mark', methods=['POST'])
+def scan_and_mark():
+    """
+    Identify the face and record attendance in one round trip.
+
+    Clients should send an `Idempotency-Key` header (or `idempotency_key`
+    parameter) per captured frame; a retry of the same frame for the same
+    field/course reaching this worker gets the original answer back without
+    re-running recognition or touching the DB (see IdempotencyCache).
+    """
+    params = request_params(request)
+    key = request.headers.get('Idempotency-Key') or params.get('idempotency_key')
+    if key:
+        key = (key, params.get('field') or '', params.get('course') or '')
+        cached = _idempotent_responses.get(key)
+        if cached is not None:
+            return jsonify(cached)
+
+    timer = StageTimer()
+    result, code = _identify(params, timer)
+    if result['status'] == 'match':
+        with timer.stage('record'):
+            outcome = attendance.mark_one(
+                result['user_id'], result['field'], result['course'], attendance.local_now()
+            )
+        result.update(MARK_RESPONSES[outcome])
+        result['status'] = outcome
 
-    img = Image.open(BytesIO(img_bytes)).convert('RGB')
-    img_np = np.array(img)
-    # img_np = cv2.resize(img_np, (0, 0), fx=0.5, fy=0.5)
-    img_np = cv2.resize(img_np, (min(img_np.shape[1], 300), min(img_np.shape[0], 300)))
+    result['timings'] = timer.as_dict()
+    if key and code == 200:
+        _idempotent_responses.put(key, result)
+    return timer.apply(jsonify(result)), code
 
-    face_encodings = face_recognition.face_encodings(img_np)
+
+def _identify(params, timer):
+    """
+    Decode, detect, encode and match the uploaded frame.
+    Returns (result dict, HTTP status code).
+    """
+    # frames still waiting for the encoder after this are stale
+    deadline = time.time() + encoder.timeout
+    field = params.get('field')
+    course = params.get('course')
+
+    with timer.stage('decode'):
+        try:
+            img_np = read_request_image(request, config.SCAN_FACE_MAX_SIDE)
+        except BadImage:
+            return {'status': 'bad-image'}, 400
+
+    # Cheap detection first: empty frames never reach the encoder
+    with timer.stage('detect'):
+        locations = detect_faces(img_np, config.FACE_DETECTOR)
+    if not locations:
+        return {'status': 'no-face'}, 200
+
+    with timer.stage('encode'):
+        face_encodings = encoder.encode(img_np, locations[:1], deadline)
     if not face_encodings:
-        return jsonify({'status': 'no-face'})
+        return {'status': 'no-face'}, 200
 
     scanned_encoding = face_encodings[0]
 
-    # Filter only users for the selected field/course
-    users = db.session.query(User).filter_by(field=field, course=course).all()
+    with timer.stage('match'):
+        # Kiosks not bound to a field/course search the whole campus
+        if not field and not course:
+            return _scan_campus(scanned_encoding), 200
+        return _scan_cohort(field, course, scanned_encoding), 200
+
+
+def _scan_cohort(field, course, scanned_encoding):
+    # Nearest neighbour over every enrolled face of the selected field/course
+    cohort = gallery.get(field, course)
+    best = cohort.best_matches(scanned_encoding)[0]
+    status = matching.verdict(best, config.FACE_MATCH_TOLERANCE, config.FACE_MATCH_MARGIN)
+    if status == 'no-match':
+        return {'status': status}
+    if status == 'ambiguous':
+        return {'status': status, 'distance': best.distance}
+
+    i = best.index
+    return {
+        'status': 'match',
+        'username': cohort.names[i],
+        'roll': int(cohort.rolls[i]),
+        'field': field,
+        'course': course,
+        'user_id': int(cohort.ids[i]),
+        'distance': best.distance
+    }
 
-    for user in users:
-        if user.face_encoding is None:
-            continue
-        known_encoding = np.frombuffer(user.face_encoding, dtype=np.float64)
-        match = face_recognition.compare_faces([known_encoding], scanned_encoding, tolerance=0.6)[0]
-        if match:
-            return jsonify({
-                'status': 'match',
-                'username': user.username,
-                'roll': user.roll,
-                'field': user.field,
-                'course': user.course,
-                'user_id': user.id
-            })
 
-    return jsonify({'status': 'no-match'})
+def _scan_campus(scanned_encoding):
+    if campus_index.enabled:
+        ids, distances = campus_index.search(scanned_encoding, k=2)
+        best_id = ids[0][0]
+        # a lone hit has no runner-up (its distance is inf; inf - inf is nan)
+        margin = distances[0][1] - distances[0][0] if ids[0][1] >= 0 else np.inf
+        match = matching.Match(int(best_id), float(distances[0][0]), float(margin)) if best_id >= 0 else None
+    else:
+        # FACE_INDEX_BACKEND=none: exact scan of the campus-wide gallery
+        campus = gallery.get(None, None)
+        match = campus.best_matches(scanned_encoding)[0]
+        best_id = campus.ids[match.index] if match is not None else -1
+    status = matching.verdict(match, config.FACE_MATCH_TOLERANCE, config.FACE_MATCH_MARGIN)
+    if status == 'no-match':
+        return {'status': status}
+    if status == 'ambiguous':
+        return {'status': status, 'distance': match.distance}
+
+    user = db.session.query(
+        User.id, User.username, User.roll, User.field, User.course
+    ).filter(User.id == int(best_id)).first()
+    if not user:
+        return {'status': 'no-match'}
+    return {
+        'status': 'match',
+        'username': user.username,
+        'roll': user.roll,
+        'field': user.field,
+        'course': user.course,
+        'user_id': user.id,
+        'distance': match.distance
+    }
 
 
 @attendance_bp.route('/mark-attendance', methods=['POST'])
 def mark_attendance():
     data = request.get_json()
-    import pytz
-    now = datetime.now(pytz.timezone('Asia/Kolkata'))
-    today = now.date()
     user_id = data['user_id']
     field = data.get('field')
     course = data.get('course')
 
-    existing = db.session.query(Attendance).filter(
-        Attendance.student_id == user_id,
-        Attendance.field == field,
-        Attendance.course == course,
-        db.func.date(Attendance.date) == today
-    ).first()
+    # Single INSERT ... ON CONFLICT DO NOTHING: double clicks and two kiosks
+    # racing on the same student can no longer create duplicate rows
+    result = attendance.mark_one(user_id, field, course, attendance.local_now())
+    return jsonify(MARK_RESPONSES[result])
 
-    if existing:
-        return jsonify({'status': 'already_marked', 'message': 'Attendance already marked for today.'})
 
-    present_time = now.replace(hour=9, minute=15, second=0, microsecond=0)
-    late_time = now.replace(hour=11, minute=30, second=0, microsecond=0)
+MARK_RESPONSES = {
+    'marked': {'status': 'marked'},
+    'already_marked': {'status': 'already_marked', 'message': 'Attendance already marked for today.'},
+    'closed': {'status': 'closed', 'message': 'Attendance window is closed. You are marked absent.'},
+}
 
-    if now <= present_time:
-        status = '✅Present'
-    elif now <= late_time:
-        status = '⏰Present-Late'
-    else:
-        return jsonify({'status': 'closed', 'message': 'Attendance window is closed. You are marked absent.'})
-
-    new_record = Attendance(
-        student_id=user_id,
-        date=datetime.utcnow(),
-        status=status,
-        field=field,
-        course=course
+
+@attendance_bp.route('/scan-frame', methods=['POST'])
+def scan_frame():
+    """
+    Recognise every face in one classroom snapshot and mark all recognised
+    students of the field/course in a single transaction.
+    """
+    params = request_params(request)
+    timer = StageTimer()
+    deadline = time.time() + encoder.timeout
+    field = params.get('field')
+    course = params.get('course')
+    if not field or not course:
+        return jsonify({'status': 'bad-request', 'message': 'Field and course are required.'}), 400
+
+    with timer.stage('decode'):
+        try:
+            img_np = read_request_image(request, config.SCAN_FRAME_MAX_SIDE)
+        except BadImage:
+            return jsonify({'status': 'bad-image'}), 400
+
+    with timer.stage('detect'):
+        locations = detect_faces(img_np, config.FACE_DETECTOR, max_side=config.SCAN_FRAME_MAX_SIDE)
+    if not locations:
+        return timer.apply(jsonify({'status': 'no-face', 'faces': [], 'timings': timer.as_dict()}))
+
+    with timer.stage('encode'):
+        encodings = encoder.encode(img_np, locations, deadline)
+
+    with timer.stage('match'):
+        cohort = gallery.get(field, course)
+        matches = cohort.best_matches(np.vstack(encodings))
+
+    faces, recognised = [], {}
+    for box, best in zip(locations, matches):
+        status = matching.verdict(best, config.FACE_MATCH_TOLERANCE, config.FACE_MATCH_MARGIN)
+        face = {'box': [int(v) for v in box], 'status': status}
+        if status == 'match':
+            user_id = int(cohort.ids[best.index])
+            face.update(
+                user_id=user_id,
+                username=cohort.names[best.index],
+                roll=int(cohort.rolls[best.index]),
+                distance=best.distance,
+            )
+            # the same student twice in one photo: keep the closer face
+            if user_id not in recognised or best.distance < recognised[user_id]['distance']:
+                recognised[user_id] = face
+        faces.append(face)
+
+    now = attendance.local_now()
+    status = attendance.status_for(now)
+    if status is None:
+        return timer.apply(jsonify({'status': 'closed', 'faces': faces, 'timings': timer.as_dict(),
+                                    'message': 'Attendance window is closed.'}))
+
+    with timer.stage('record'):
+        marked = set(attendance.mark_many(list(recognised), field, course, status, now))
+    for user_id, face in recognised.items():
+        face['attendance'] = 'marked' if user_id in marked else 'already_marked'
+
+    return timer.apply(jsonify({'status': 'ok', 'faces': faces, 'marked': len(marked),
+                                'timings': timer.as_dict()}))
+
+
+# Largest single frame accepted on /scan-stream
+STREAM_FRAME_LIMIT = 5 * 1024 * 1024
+
+
+@attendance_bp.route('/scan-stream', methods=['POST'])
+def scan_stream():
+    """
+    Continuous scanning for a kiosk camera over one long-lived request.
+
+    The request body is a stream of frames, each a 4-byte big-endian length
+    followed by that many bytes of JPEG. The response is newline-delimited
+    JSON events written as they happen: match, unknown, lost, busy, error
+    and a final end with counters. Faces are tracked between frames and
+    only new or unidentified tracks are encoded.
+
+    Query parameters: field and course (omit both for a campus-wide
+    search), and mark=1 to record attendance for every student matched.
+    """
+    field = request.args.get('field')
+    course = request.args.get('course')
+    mark = request.args.get('mark', '').lower() in ('1', 'true', 'yes')
+    frames = _read_frames(request.stream)
+
+    def generate():
+        for event in _stream_events(frames, field, course, mark):
+            yield json.dumps(event) + '\n'
+
+    return current_app.response_class(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'}
     )
-    db.session.add(new_record)
-    db.session.commit()
-    return jsonify({'status': 'marked'})
\ No newline at end of file
+
+
+def _read_exactly(stream, size):
+    chunks = []
+    while size > 0:
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _read_frames(stream):
+    """Length-prefixed frames until the client closes its side."""
+    while True:
+        header = _read_exactly(stream, 4)
+        if len(header) < 4:
+            return
+        size = int.from_bytes(header, 'big')
+        if size > STREAM_FRAME_LIMIT:
+            raise BadImage(f"Frame of {size} bytes exceeds the {STREAM_FRAME_LIMIT} byte limit.")
+        data = _read_exactly(stream, size)
+        if len(data) < size:
+            return
+        yield data
+
+
+def _stream_events(frames, field, course, mark):
+    tracker = FaceTracker()
+    stats = {'frames': 0, 'faces': 0, 'encoded': 0}
+    try:
+        for data in frames:
+            stats['frames'] += 1
+            deadline = time.time() + encoder.timeout
+            try:
+                img_np = decode_image(data, config.SCAN_STREAM_MAX_SIDE)
+            except BadImage as e:
+                yield {'event': 'error', 'message': str(e)}
+                continue
+
+            boxes = detect_faces(img_np, config.FACE_DETECTOR, max_side=config.SCAN_STREAM_MAX_SIDE)
+            stats['faces'] += len(boxes)
+            due, dropped = tracker.update(boxes)
+            for track in dropped:
+                yield {'event': 'lost', 'track': track.id}
+            if not due:
+                continue
+
+            try:
+                encodings = encoder.encode(img_np, [t.box for t in due], deadline)
+            except EncoderBusy as e:
+                # tracks stay due and are retried on the next frame
+                yield {'event': 'busy', 'retry_after': e.retry_after}
+                continue
+            stats['encoded'] += len(encodings)
+
+            for track, encoding in zip(due, encodings):
+                event = _track_result(tracker, track, encoding, field, course, mark)
+                if event:
+                    yield event
+    except BadImage as e:
+        yield {'event': 'error', 'message': str(e)}
+    yield {'event': 'end', **stats}
+
+
+def _track_result(tracker, track, encoding, field, course, mark):
+    """Record a track's match; returns an event only when its identity changed."""
+    if not field and not course:
+        result = _scan_campus(encoding)
+    else:
+        result = _scan_cohort(field, course, encoding)
+
+    previous = track.result
+    if previous is not None and previous.get('status') == 'match' and result['status'] != 'match':
+        # a blurred re-check does not take an identity away
+        tracker.record(track, previous)
+        return None
+    tracker.record(track, result)
+    if previous is not None and previous.get('status') == result['status'] \
+            and previous.get('user_id') == result.get('user_id'):
+        return None
+
+    event = {
+        'event': 'match' if result['status'] == 'match' else 'unknown',
+        'track': track.id,
+        'box': [int(v) for v in track.box],
+        **result
+    }
+    if mark and result['status'] == 'match':
+        event['attendance'] = attendance.mark_one(
+            result['user_id'], result['field'], result['course'], attendance.local_now()
+        )
+    return event
@@ -1,5 +1,6 @@
 from flask import request, jsonify, session, Blueprint, render_template, redirect, url_for, flash
 from flask_login import login_user, logout_user, login_required, current_user
+from app.cohorts import catalog, enrol
 from app.extensions import db
 from app.models.models import User
 
@@ -11,7 +12,7 @@ def login():
     username = data.get('username', '').strip()
     password = data.get('password', '')
 
-    user = db.session.query(User).filter_by(username=username).first()
+    user = db.session.query(User).options(db.undefer(User.password_hash)).filter_by(username=username).first()
     if user and user.check_password(password):
         login_user(user)
         session['user_id'] = user.id
@@ -35,7 +36,9 @@ def register():
     new_user = User(username=username, email=email, roll=0, field='-', course='-')
     new_user.set_password(password)
     db.session.add(new_user)
+    enrol([(new_user.field, new_user.course, 1)])
     db.session.commit()
+    catalog.invalidate()
     return jsonify({"success": True, "message": "Registration successful! You can now log in."})
 
 
@@ -108,4 +108,64 @@ document.addEventListener('DOMContentLoaded', function() {
         clearTimeout(resizeTimer);
         resizeTimer = setTimeout(handleResponsiveTable, 100);
     });
-});
\ No newline at end of file
+
+    // Live updates: a snapshot of the day's marks, then one event per change
+    const summaryEl = document.getElementById('attendanceSummary');
+    if (!summaryEl || !summaryEl.dataset.liveUrl || !window.EventSource) return;
+
+    const marks = {};  // student id -> {status, time}
+
+    function renderRow(studentId) {
+        const row = document.querySelector(`.attendance-row[data-student-id="${studentId}"]`);
+        if (!row) return;
+        const mark = marks[studentId];
+        row.querySelector('.date-cell').textContent = mark ? mark.time : 'N/A';
+        const badge = document.createElement('span');
+        badge.className = mark ? 'badge bg-success' : 'badge bg-danger';
+        badge.textContent = mark ? mark.status : 'Absent';
+        row.querySelector('.status-cell').replaceChildren(badge);
+    }
+
+    function renderCounts() {
+        let present = 0, late = 0;
+        Object.values(marks).forEach(mark => {
+            if (mark.status === summaryEl.dataset.presentStatus) present++;
+            else if (mark.status === summaryEl.dataset.lateStatus) late++;
+        });
+        document.getElementById('presentCount').textContent = present;
+        document.getElementById('lateCount').textContent = late;
+        document.getElementById('unmarkedCount').textContent =
+            Math.max(parseInt(summaryEl.dataset.students, 10) - present - late, 0);
+    }
+
+    function applyMark(item) {
+        if (item.status) {
+            marks[item.student_id] = item;
+        } else {
+            delete marks[item.student_id];
+        }
+        renderRow(item.student_id);
+    }
+
+    const events = new EventSource(summaryEl.dataset.liveUrl);
+    events.addEventListener('snapshot', function(e) {
+        Object.keys(marks).forEach(id => delete marks[id]);
+        JSON.parse(e.data).items.forEach(item => { marks[item.student_id] = item; });
+        document.querySelectorAll('.attendance-row').forEach(row => renderRow(row.dataset.studentId));
+        renderCounts();
+    });
+    events.addEventListener('mark', function(e) {
+        applyMark(JSON.parse(e.data));
+        renderCounts();
+    });
+    events.addEventListener('reload', function() {
+        events.close();
+        window.location.reload();
+    });
+    events.onerror = function() {
+        // the server refused the stream (too many open): fall back to reloading
+        if (events.readyState === EventSource.CLOSED) {
+            setTimeout(() => window.location.reload(), 30000);
+        }
+    };
+});
@@ -323,20 +323,31 @@ function captureAndSend() {
     const ctx = canvas.getContext('2d');
     
     ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
-    const image = canvas.toDataURL('image/jpeg');
     const field = document.getElementById('field').value;
     const course = document.getElementById('course').value;
+    const key = newIdempotencyKey();
     
-    fetch('/scan-face', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json'
-        },
-        body: JSON.stringify({ image, field, course })
+    // Send the JPEG as a raw binary body (no base64/JSON wrapping)
+    new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', 0.9))
+    .then(blob => sendFrame(blob, field, course, key, 3));
+}
+
+function sendFrame(blob, field, course, key, busyRetries) {
+    postScan(blob, field, course, key, 1)
+    .then(res => {
+        // 503: the encoder pool is saturated, not an unknown face; wait as told
+        if (res.status === 503 && busyRetries > 0) {
+            const wait = parseInt(res.headers.get('Retry-After'), 10) || 1;
+            showAttendanceAlert('info', `Scanner busy, retrying in ${wait} s...`);
+            setTimeout(() => sendFrame(blob, field, course, key, busyRetries - 1), wait * 1000);
+            return null;
+        }
+        return res.json();
     })
-    .then(res => res.json())
     .then(data => {
-        if (data.status === 'match') {
+        if (!data) return;
+        // a recognised student comes back already marked (or already_marked / closed)
+        if (data.user_id) {
             document.getElementById('student-info').style.display = 'block';
             document.getElementById('student-info-heading').style.display = 'block';
             document.getElementById('student-name').innerText = data.username;
@@ -344,7 +355,15 @@ function captureAndSend() {
             document.getElementById('student-field').innerText = data.field;
             document.getElementById('student-course').innerText = data.course;
             
-            showCountdownAndConfirm(data, field, course);
+            showAttendanceResult(data, field, course);
+        } else if (data.status === 'busy') {
+            alert("The scanner is busy. Please scan again in a moment.");
+        } else if (data.status === 'ambiguous') {
+            alert("Face is too close to more than one student. Please face the camera and scan again.");
+        } else if (data.status === 'bad-image') {
+            alert("Could not read the camera image. Please scan again.");
+        } else if (data.status === 'no-face') {
+            alert("No face detected. Please face the camera and scan again.");
         } else {
             alert("Face not recognized.");
         }
@@ -354,56 +373,18 @@ function captureAndSend() {
     });
 }
 
-function showCountdownAndConfirm(data, field, course) {
-    const countdownEl = document.getElementById('scan-countdown');
-    const countdownNumber = document.getElementById('countdown-number');
-    const countdownText = document.getElementById('countdown-text');
-    const confirmButton = document.getElementById('mark-attendance');
-    const delaySelect = document.getElementById('scanDelay');
-    
-    // Use user-selected or fallback default delay
-    function getDefaultDelay() {
-        const isMobile = /Mobi|Android/i.test(navigator.userAgent);
-        return isMobile ? 7 : 5;
-    }
-    
-    if (!delaySelect.value) {
-        delaySelect.value = getDefaultDelay();
-    }
-    
-    let seconds = parseInt(delaySelect.value) || 6;
-    countdownEl.style.display = 'block';
-    
-    // Countdown logic
-    const interval = setInterval(() => {
-        seconds--;
-        countdownNumber.innerText = seconds;
-        countdownText.innerText = seconds;
-        
-        if (seconds <= 0) {
-            clearInterval(interval);
-            countdownEl.style.display = 'none';
-            confirmAttendance(); // Automatically confirm if user does not act
-        }
-    }, 1000);
-    
-    // If user clicks confirm manually
-    confirmButton.onclick = () => {
-        clearInterval(interval);
-        countdownEl.style.display = 'none';
-        confirmAttendance();
-    };
-    
-    // Submission logic
-    function confirmAttendance() {
-        fetch('/mark-attendance', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({ user_id: data.user_id, field, course })
-        }).then(() => {
-            window.location.href = `/attendance-dashboard/${field}/${course}`;
-        });
-    }
-}
\ No newline at end of file
+// Identify and mark in one request; a lost response is retried with the same key
+function postScan(blob, field, course, key, retries) {
+    return fetch(`/scan-and-mark?${new URLSearchParams({ field, course })}`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'image/jpeg',
+            'Idempotency-Key': key
+        },
+        body: blob
+    })
+    .catch(error => {
+        if (retries > 0) return postScan(blob, field, course, key, retries - 1);
+        throw error;
+    });
+}
@@ -0,0 +1,35 @@
+"""
+Cloudinary image storage.
+
+The SDK is imported and configured on the first upload rather than at app
+import, which keeps it (and its HTTP stack) off the startup path.
+"""
+import os
+import threading
+
+
+_lock = threading.Lock()
+_uploader = None
+
+
+def upload(file, **options):
+    """cloudinary.uploader.upload(file, **options) with the app's credentials."""
+    return _get_uploader().upload(file, **options)
+
+
+def _get_uploader():
+    global _uploader
+    with _lock:
+        if _uploader is None:
+            import cloudinary
+            import cloudinary.uploader
+
+            # read from environment / Railway variables
+            cloudinary.config(
+                cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
+                api_key=os.getenv("CLOUDINARY_API_KEY"),
+                api_secret=os.getenv("CLOUDINARY_API_SECRET"),
+                secure=True,
+            )
+            _uploader = cloudinary.uploader
+        return _uploader
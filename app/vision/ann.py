@@ -0,0 +1,446 @@
+"""
+Approximate nearest-neighbour search over every enrolled face, used by
+campus-wide kiosks that are not bound to one field/course.
+
+Two backends share the same small interface (build/add/remove/search/save/load):
+
+* IVFIndex  - pure NumPy inverted-file index: a k-means coarse quantizer
+              splits the gallery into lists, a query scans only the `nprobe`
+              closest lists and ranks those candidates exactly.
+* HNSWIndex - thin wrapper around the optional `hnswlib` package.
+
+CampusIndex owns the process-wide instance, builds it at startup and keeps a
+copy on local disk so every gunicorn worker loads the same index instead of
+rebuilding it. For IVF the inverted lists are only rewritten when the index
+is compacted; an enrolment or deletion rewrites just the small tail file
+(new faces plus removed ids).
+"""
+import fcntl
+import json
+import os
+import secrets
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from app.vision import matching
+from app.vision.gallery import load_face_matrix, table_fingerprint
+
+
+class IVFIndex:
+    backend = 'ivf'
+
+    # Newly added faces are kept in an exact "tail" until there are this many,
+    # then folded into the inverted lists.
+    tail_limit = 1024
+
+    def __init__(self, dim=128, nlist=None, nprobe=8, seed=0):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.seed = seed
+        self.centroids = np.empty((0, dim), dtype=np.float32)
+        self.generation = 0  # random id of the current layout; ties a tail file to its lists
+        self._clear()
+
+    def _clear(self):
+        self._ids = np.empty(0, dtype=np.int64)
+        self._vectors = np.empty((0, self.dim), dtype=np.float32)
+        self._sq_norms = np.empty(0, dtype=np.float32)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._alive = np.empty(0, dtype=bool)
+        self._tail_ids = np.empty(0, dtype=np.int64)
+        self._tail_vectors = np.empty((0, self.dim), dtype=np.float32)
+
+    def __len__(self):
+        return int(self._alive.sum()) + len(self._tail_ids)
+
+    def fingerprint(self):
+        """(count, max id) of the indexed faces, comparable with the table's."""
+        ids = np.concatenate((self._ids[self._alive], self._tail_ids))
+        return [len(ids), int(ids.max()) if len(ids) else 0]
+
+    # -- building ---------------------------------------------------------
+    def build(self, ids, vectors):
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        self.centroids = self._train(vectors)
+        self._clear()
+        self._layout(ids, vectors)
+
+    def _train(self, vectors, iterations=10):
+        n = len(vectors)
+        nlist = self.nlist or max(1, int(np.sqrt(n)))
+        nlist = min(nlist, n) if n else 1
+        if n == 0:
+            return np.zeros((1, self.dim), dtype=np.float32)
+
+        rng = np.random.default_rng(self.seed)
+        # k-means on a sample is plenty for a coarse quantizer
+        sample = vectors[rng.choice(n, size=min(n, nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=nlist)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+        return centroids
+
+    @staticmethod
+    def _assign(vectors, centroids):
+        return matching.pairwise_distances(centroids, vectors).argmin(axis=1)
+
+    def _layout(self, ids, vectors):
+        """Store vectors grouped by list so each list is one contiguous slice."""
+        assign = self._assign(vectors, self.centroids) if len(vectors) else np.empty(0, dtype=np.int64)
+        order = np.argsort(assign, kind='stable')
+        self._ids = ids[order]
+        self._vectors = np.ascontiguousarray(vectors[order])
+        self._sq_norms = matching.squared_norms(self._vectors)
+        self._alive = np.ones(len(ids), dtype=bool)
+        counts = np.bincount(assign, minlength=len(self.centroids))
+        self._offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self._tail_ids = np.empty(0, dtype=np.int64)
+        self._tail_vectors = np.empty((0, self.dim), dtype=np.float32)
+        self.generation = secrets.randbits(63)
+
+    def _compact(self):
+        ids = np.concatenate((self._ids[self._alive], self._tail_ids))
+        vectors = np.concatenate((self._vectors[self._alive], self._tail_vectors))
+        self._layout(ids, vectors)
+
+    # -- incremental updates ----------------------------------------------
+    def add(self, ids, vectors):
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        self.remove(ids)
+        self._tail_ids = np.concatenate((self._tail_ids, ids))
+        self._tail_vectors = np.concatenate((self._tail_vectors, vectors))
+        if len(self._tail_ids) > self.tail_limit:
+            self._compact()
+
+    def remove(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        self._alive &= ~np.isin(self._ids, ids)
+        keep = ~np.isin(self._tail_ids, ids)
+        self._tail_ids = self._tail_ids[keep]
+        self._tail_vectors = self._tail_vectors[keep]
+        if len(self._alive) and (~self._alive).sum() > len(self._alive) // 10:
+            self._compact()
+
+    # -- querying ---------------------------------------------------------
+    def search(self, probes, k=2):
+        """Ids and distances of the k nearest faces per probe (-1 / inf padded)."""
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        out_ids = np.full((len(probes), k), -1, dtype=np.int64)
+        out_distances = np.full((len(probes), k), np.inf)
+
+        nprobe = min(self.nprobe, len(self.centroids))
+        coarse = matching.pairwise_distances(self.centroids, probes)
+        for row, probe in enumerate(probes):
+            lists = np.argpartition(coarse[row], nprobe - 1)[:nprobe]
+
+            # Score each probed list on its contiguous slice, no gathering copies
+            ids, distances = [self._tail_ids], [self._distances(self._tail_vectors, probe)]
+            for i in lists:
+                lo, hi = self._offsets[i], self._offsets[i + 1]
+                if hi > lo:
+                    alive = self._alive[lo:hi]
+                    ids.append(self._ids[lo:hi][alive])
+                    distances.append(self._distances(self._vectors[lo:hi], probe, self._sq_norms[lo:hi])[alive])
+
+            ids, distances = np.concatenate(ids), np.concatenate(distances)
+            if not len(ids):
+                continue
+            indices, nearest = matching.top_k(distances, k)
+            out_ids[row, :indices.shape[1]] = ids[indices[0]]
+            out_distances[row, :indices.shape[1]] = nearest[0]
+        return out_ids, out_distances
+
+    @staticmethod
+    def _distances(vectors, probe, sq_norms=None):
+        if not len(vectors):
+            return np.empty(0, dtype=np.float32)
+        return matching.pairwise_distances(vectors, probe, sq_norms)[0]
+
+    # -- persistence ------------------------------------------------------
+    def save(self, path):
+        """Write the inverted lists to `path` and the tail to tail_path(path)."""
+        with open(path, 'wb') as fh:
+            np.savez(
+                fh,
+                centroids=self.centroids,
+                ids=self._ids,
+                vectors=self._vectors,
+                offsets=self._offsets,
+                nprobe=self.nprobe,
+                generation=self.generation,
+            )
+        self.save_tail(tail_path(path))
+
+    def save_tail(self, path):
+        """Write only what changed since the last re-layout: tail faces and removed ids."""
+        with open(path, 'wb') as fh:
+            np.savez(
+                fh,
+                generation=self.generation,
+                tail_ids=self._tail_ids,
+                tail_vectors=self._tail_vectors,
+                removed=self._ids[~self._alive],
+            )
+
+    @classmethod
+    def load(cls, path, tail=None):
+        with np.load(path) as data:
+            index = cls(dim=data['vectors'].shape[1], nprobe=int(data['nprobe']))
+            index.centroids = data['centroids']
+            index._ids = data['ids']
+            index._vectors = data['vectors']
+            index._sq_norms = matching.squared_norms(index._vectors)
+            index._offsets = data['offsets']
+            index._alive = np.ones(len(index._ids), dtype=bool)
+            index.generation = int(data['generation']) if 'generation' in data else 0
+        tail = tail or tail_path(path)
+        try:
+            with np.load(tail) as data:
+                # a tail written for older lists was folded in by the re-layout
+                if int(data['generation']) == index.generation:
+                    index._tail_ids = data['tail_ids']
+                    index._tail_vectors = data['tail_vectors']
+                    index._alive &= ~np.isin(index._ids, data['removed'])
+        except FileNotFoundError:
+            pass
+        return index
+
+
+def tail_path(path):
+    return Path(f"{path}.tail.npz")
+
+
+class HNSWIndex:
+    backend = 'hnsw'
+
+    def __init__(self, dim=128, M=16, ef_construction=200, ef=64):
+        self.dim = dim
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef = ef
+        self._index = None
+        self._ids = set()
+        self._init(1024)
+
+    def _init(self, capacity, path=None):
+        import hnswlib
+
+        self._index = hnswlib.Index(space='l2', dim=self.dim)
+        if path is None:
+            self._index.init_index(
+                max_elements=capacity, M=self.M, ef_construction=self.ef_construction,
+                allow_replace_deleted=True
+            )
+        else:
+            self._index.load_index(str(path), max_elements=capacity, allow_replace_deleted=True)
+        self._index.set_ef(self.ef)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def fingerprint(self):
+        return [len(self._ids), max(self._ids, default=0)]
+
+    def build(self, ids, vectors):
+        self._ids = set()
+        self._init(max(1024, 2 * len(ids)))
+        self.add(ids, vectors)
+
+    def add(self, ids, vectors):
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids):
+            return
+        self.remove(ids)
+        needed = self._index.get_current_count() + len(ids)
+        if needed > self._index.get_max_elements():
+            self._index.resize_index(2 * needed)
+        self._index.add_items(np.asarray(vectors, dtype=np.float32), ids, replace_deleted=True)
+        self._ids.update(int(i) for i in ids)
+
+    def remove(self, ids):
+        for i in np.asarray(ids, dtype=np.int64):
+            if int(i) in self._ids:
+                self._index.mark_deleted(int(i))
+                self._ids.discard(int(i))
+
+    def search(self, probes, k=2):
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        out_ids = np.full((len(probes), k), -1, dtype=np.int64)
+        out_distances = np.full((len(probes), k), np.inf)
+        found = min(k, len(self._ids))
+        if found:
+            labels, sq = self._index.knn_query(probes, k=found)
+            out_ids[:, :found] = labels
+            out_distances[:, :found] = np.sqrt(np.maximum(sq, 0.0))
+        return out_ids, out_distances
+
+    def save(self, path):
+        self._index.save_index(str(path))
+        with open(f"{path}.json", 'w') as fh:
+            json.dump({'ids': sorted(self._ids), 'dim': self.dim}, fh)
+
+    @classmethod
+    def load(cls, path):
+        with open(f"{path}.json") as fh:
+            meta = json.load(fh)
+        index = cls(dim=meta['dim'])
+        index._ids = set(meta['ids'])
+        index._init(max(1024, 2 * len(index._ids)), path=path)
+        return index
+
+
+BACKENDS = {'ivf': IVFIndex, 'hnsw': HNSWIndex}
+
+
+class CampusIndex:
+    """
+    Process-wide ANN index over attendance_student.face_encoding.
+
+    The index file is the source of truth shared by all workers: writers take
+    an exclusive file lock, fold in the latest copy from disk, apply their
+    change and write it back atomically; readers reload whenever the file's
+    mtime moves.
+    """
+
+    def __init__(self):
+        self.backend = 'ivf'
+        self.path = None
+        self.nprobe = 8
+        self._index = None
+        self._mtime = None
+        self._saved_generation = None  # IVF lists generation currently on disk
+        self._lock = threading.Lock()
+
+    def configure(self, backend, path, nprobe=8):
+        self.backend = backend
+        self.path = Path(path)
+        self.nprobe = nprobe
+
+    @property
+    def enabled(self):
+        return self.backend in BACKENDS and self.path is not None
+
+    def _new_index(self):
+        if self.backend == 'ivf':
+            return IVFIndex(nprobe=self.nprobe)
+        return BACKENDS[self.backend]()
+
+    # -- persistence ------------------------------------------------------
+    def _file_lock(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fh = open(f"{self.path}.lock", 'w')
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        return fh
+
+    def _disk_mtime(self):
+        """Modification times of the index file and, for IVF, its tail file."""
+        mtimes = [os.stat(self.path).st_mtime_ns]
+        if self.backend == 'ivf':
+            try:
+                mtimes.append(os.stat(tail_path(self.path)).st_mtime_ns)
+            except FileNotFoundError:
+                mtimes.append(None)
+        return mtimes
+
+    def _load_from_disk(self):
+        self._mtime = self._disk_mtime()
+        self._index = BACKENDS[self.backend].load(self.path)
+        self._saved_generation = getattr(self._index, 'generation', None)
+
+    def _save_to_disk(self):
+        generation = getattr(self._index, 'generation', None)
+        if generation is not None and generation == self._saved_generation:
+            # lists unchanged since they were written: only the tail moved
+            tmp = Path(f"{tail_path(self.path)}.tmp")
+            self._index.save_tail(tmp)
+            os.replace(tmp, tail_path(self.path))
+        else:
+            tmp = Path(f"{self.path}.tmp")
+            self._index.save(tmp)
+            if self.backend == 'hnsw':
+                os.replace(f"{tmp}.json", f"{self.path}.json")
+            os.replace(tmp, self.path)
+            if self.backend == 'ivf':
+                # after the lists: until then readers ignore it (other generation)
+                os.replace(tail_path(tmp), tail_path(self.path))
+            self._saved_generation = generation
+        self._mtime = self._disk_mtime()
+
+    def _refresh(self):
+        try:
+            mtime = self._disk_mtime()
+        except FileNotFoundError:
+            return
+        if mtime != self._mtime:
+            self._load_from_disk()
+
+    # -- database ---------------------------------------------------------
+    @staticmethod
+    def _load_encodings():
+        return load_face_matrix()
+
+    # -- public API -------------------------------------------------------
+    def ensure_built(self):
+        """Load the shared index file, rebuilding it if it is missing or stale."""
+        if not self.enabled:
+            return
+        with self._lock:
+            lock = self._file_lock()
+            try:
+                if self.path.exists():
+                    try:
+                        self._load_from_disk()
+                        if self._index.fingerprint() == table_fingerprint():
+                            return
+                    except Exception:
+                        pass
+                self._index = self._new_index()
+                self._index.build(*self._load_encodings())
+                self._save_to_disk()
+            finally:
+                lock.close()
+
+    def _update(self, apply):
+        if not self.enabled:
+            return
+        with self._lock:
+            lock = self._file_lock()
+            try:
+                self._refresh()
+                if self._index is None:
+                    self._index = self._new_index()
+                    self._index.build(*self._load_encodings())
+                else:
+                    apply(self._index)
+                self._save_to_disk()
+            finally:
+                lock.close()
+
+    def add(self, user_id, encoding):
+        self._update(lambda index: index.add([user_id], np.asarray(encoding, dtype=np.float32)[None, :]))
+
+    def remove(self, user_id):
+        self._update(lambda index: index.remove([user_id]))
+
+    def search(self, probes, k=2):
+        """Ids and distances of the k nearest enrolled faces per probe."""
+        if not self.enabled:
+            raise RuntimeError("Campus-wide face index is disabled.")
+        if self._index is None:
+            self.ensure_built()
+        with self._lock:
+            self._refresh()
+            return self._index.search(probes, k)
+
+
+campus_index = CampusIndex()
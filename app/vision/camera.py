@@ -1,13 +1,14 @@
 import re
 import base64
-import pickle
 from pathlib import Path
 from io import BytesIO
 
-import cv2
 import numpy as np
-from PIL import Image
-import face_recognition
+
+from app.vision.encoder import encoder
+
+# cv2, PIL and face_recognition are imported on first use: importing this module
+# (and the registration routes that use it) stays cheap
 
 
 def capture_and_store_face(image_data: str, username: str, roll: int, upload_dir: str) -> str:
@@ -15,6 +16,9 @@ def capture_and_store_face(image_data: str, username: str, roll: int, upload_dir
     Saves the base64 image to <upload_dir>/<safe_filename>.jpg
     Returns the absolute path string (e.g., 'faces/Name_1.jpg').
     """
+    import cv2
+    from PIL import Image
+
     if not image_data or not image_data.startswith("data:image"):
         raise ValueError("Invalid or empty base64 image received.")
 
@@ -41,11 +45,15 @@ def get_face_encodings(image_path: Path):
     """
     Returns a list of face encodings from the given image.
     Can be multiple if multiple faces/angles are detected.
+    Encoding runs in the shared encoder pool and may raise EncoderBusy.
     """
+    import cv2
+    import face_recognition
+
     image = face_recognition.load_image_file(str(image_path))
     image = cv2.resize(image, (0, 0), fx=0.5, fy=0.5)
 
-    encodings = face_recognition.face_encodings(image)
+    encodings = encoder.encode(image)
     if encodings:
         return encodings  # list of 128-d vectors
     return []
@@ -0,0 +1,80 @@
+"""
+Face detection front stage.
+
+Detection runs before the expensive 128-d encoding so empty frames are
+rejected cheaply and face_encodings() only works on the boxes found here.
+Boxes use face_recognition's (top, right, bottom, left) convention.
+
+Detectors:
+    haar      - OpenCV cascade bundled with the repo (fastest)
+    hog       - dlib HOG via face_recognition.face_locations
+    hog-small - dlib HOG on a half-size copy, boxes scaled back up
+"""
+import threading
+from pathlib import Path
+
+# cv2 and face_recognition are imported on first use: importing this module
+# (and the blueprints that use it) stays cheap
+
+
+CASCADE_PATH = Path(__file__).with_name('haarcascade_frontalface_default.xml')
+
+# CascadeClassifier instances are not safe to share between threads
+_local = threading.local()
+
+
+def _cascade():
+    import cv2
+
+    cascade = getattr(_local, 'cascade', None)
+    if cascade is None:
+        cascade = cv2.CascadeClassifier(str(CASCADE_PATH))
+        if cascade.empty():
+            raise RuntimeError(f"Could not load face cascade from {CASCADE_PATH}")
+        _local.cascade = cascade
+    return cascade
+
+
+def _detect_haar(rgb, max_side):
+    import cv2
+
+    gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+    scale = min(1.0, max_side / max(gray.shape[:2]))
+    if scale < 1.0:
+        gray = cv2.resize(gray, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    gray = cv2.equalizeHist(gray)
+
+    boxes = _cascade().detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(24, 24))
+    h, w = rgb.shape[:2]
+    locations = []
+    for x, y, bw, bh in boxes:
+        top, left = int(y / scale), int(x / scale)
+        bottom, right = min(h, int((y + bh) / scale)), min(w, int((x + bw) / scale))
+        locations.append((top, right, bottom, left))
+    return locations
+
+
+def _detect_hog(rgb, factor=1.0):
+    import cv2
+    import face_recognition
+
+    if factor == 1.0:
+        return face_recognition.face_locations(rgb, model='hog')
+    small = cv2.resize(rgb, (0, 0), fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+    return [
+        tuple(int(v / factor) for v in box)
+        for box in face_recognition.face_locations(small, model='hog')
+    ]
+
+
+def detect_faces(rgb, method='haar', max_side=640):
+    """Face boxes in an RGB image, largest first."""
+    if method == 'haar':
+        locations = _detect_haar(rgb, max_side)
+    elif method == 'hog-small':
+        locations = _detect_hog(rgb, factor=0.5)
+    elif method == 'hog':
+        locations = _detect_hog(rgb)
+    else:
+        raise ValueError(f"Unknown face detector: {method}")
+    return sorted(locations, key=lambda b: (b[2] - b[0]) * (b[1] - b[3]), reverse=True)
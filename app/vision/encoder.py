@@ -0,0 +1,182 @@
+"""
+Face encoding off the request threads.
+
+dlib's 128-d encoder is CPU-bound and holds the GIL, so running it inside a
+gthread worker stalls every other route served by that process. Encodings
+are instead computed by a small process pool owned by each web worker.
+
+The pool is bounded: at most `max_pending` frames may be queued or running.
+Past that, `encode()` fails fast with EncoderBusy (served as 503 with
+Retry-After) instead of letting requests pile up. Each job carries a
+deadline; a frame still waiting when its deadline passes is dropped rather
+than encoded, since the kiosk has long since sent a newer one.
+
+With `workers=0` encoding runs in the calling thread (same limits), which
+is handy for local development.
+"""
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+# A blank frame and box: encoding it loads and initialises the dlib models
+WARM_FRAME = np.zeros((160, 160, 3), dtype=np.uint8)
+WARM_BOX = (0, 150, 150, 0)
+
+
+class EncoderBusy(RuntimeError):
+    """The pool is saturated (or restarting); the client should retry later."""
+
+    def __init__(self, message="Face encoder is busy.", retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class EncoderTimeout(EncoderBusy):
+    """The frame was not encoded before its deadline."""
+
+
+def _encode(rgb, locations, deadline):
+    # runs in a pool process; None means the frame went stale in the queue
+    if deadline is not None and time.time() > deadline:
+        return None
+    import face_recognition
+
+    return face_recognition.face_encodings(rgb, known_face_locations=locations)
+
+
+def _init_process(barrier):
+    # each pool process warms its own models; the barrier holds every
+    # process until all of them are warm, so one finished ping means all are
+    _encode(WARM_FRAME, [WARM_BOX], None)
+    try:
+        barrier.wait(timeout=120)
+    except threading.BrokenBarrierError:
+        pass
+
+
+def _ping():
+    return True
+
+
+class EncoderPool:
+    def __init__(self, workers=1, max_pending=4, timeout=5.0, retry_after=1):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def configure(self, workers=None, max_pending=None, timeout=None):
+        with self._lock:
+            if workers is not None and workers != self.workers:
+                self._shutdown()
+                self.workers = workers
+            if max_pending is not None:
+                self.max_pending = max_pending
+            if timeout is not None:
+                self.timeout = timeout
+
+    def start(self):
+        """
+        Launch the pool processes now and wait until every one of them has
+        loaded its models. Called by start_background(), before the web
+        worker starts its request threads, so they fork from a quiet process
+        instead of from under a busy request.
+        """
+        if self.workers > 0:
+            executor = self._get_executor()
+            for future in [executor.submit(_ping) for _ in range(self.workers)]:
+                future.result()
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def encode(self, rgb, locations=None, deadline=None):
+        """
+        face_recognition.face_encodings(rgb, locations), computed in the pool.
+        `deadline` is a time.time() timestamp (default: now + timeout).
+        Raises EncoderBusy when saturated, EncoderTimeout when the deadline passes.
+        """
+        if deadline is None:
+            deadline = time.time() + self.timeout
+
+        self._acquire()
+        if self.workers <= 0:
+            try:
+                encodings = _encode(rgb, locations, deadline)
+            finally:
+                self._release()
+        else:
+            encodings = self._submit(rgb, locations, deadline)
+
+        if encodings is None:
+            raise EncoderTimeout("Frame expired before it could be encoded.", self.retry_after)
+        return encodings
+
+    # -- internals --------------------------------------------------------
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise EncoderBusy(retry_after=self.retry_after)
+            self._pending += 1
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+
+    def _submit(self, rgb, locations, deadline):
+        executor = self._get_executor()
+        try:
+            future = executor.submit(_encode, rgb, locations, deadline)
+        except BrokenProcessPool:
+            self._release()
+            self._reset(executor)
+            raise EncoderBusy("Face encoder is restarting.", self.retry_after)
+        except BaseException:
+            self._release()
+            raise
+        # the slot is held until the job really finishes, even if we stop waiting
+        future.add_done_callback(self._release)
+
+        try:
+            return future.result(timeout=max(0.0, deadline - time.time()))
+        except FutureTimeout:
+            future.cancel()
+            raise EncoderTimeout("Frame expired before it could be encoded.", self.retry_after)
+        except BrokenProcessPool:
+            self._reset(executor)
+            raise EncoderBusy("Face encoder is restarting.", self.retry_after)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # fork, not spawn/forkserver: those re-import __main__ (run.py
+                # would build a whole app per encoder process)
+                methods = multiprocessing.get_all_start_methods()
+                ctx = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=ctx,
+                    initializer=_init_process, initargs=(ctx.Barrier(self.workers),)
+                )
+            return self._executor
+
+    def _reset(self, broken):
+        # a worker died; the next submit starts a fresh pool
+        with self._lock:
+            if self._executor is broken:
+                self._shutdown()
+
+    def _shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+encoder = EncoderPool()
@@ -0,0 +1,341 @@
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import type_coerce, LargeBinary
+
+from app.extensions import db
+from app.models.types import stack_faces
+from app.vision import matching
+
+
+class Cohort:
+    """
+    Face embeddings of one (field, course) held as a single contiguous
+    (N, 128) matrix, with parallel id/roll/name arrays in the same row order.
+    """
+
+    def __init__(self, ids, rolls, names, matrix, sq_norms=None):
+        self.ids = ids
+        self.rolls = rolls
+        self.names = names
+        self.matrix = matrix
+        self.sq_norms = matching.squared_norms(matrix) if sq_norms is None else sq_norms
+        self.loaded_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def distances(self, encodings):
+        """(M, N) Euclidean distances from M probe encodings to every row."""
+        return matching.pairwise_distances(self.matrix, encodings, self.sq_norms)
+
+    def best_matches(self, encodings):
+        """Nearest row for each probe encoding, with its margin to the runner-up."""
+        if not len(self):
+            return [None] * len(np.atleast_2d(encodings))
+        return matching.best_matches(self.distances(encodings))
+
+    def top_k(self, encodings, k):
+        """Row indices and distances of the k nearest rows for each probe."""
+        return matching.top_k(self.distances(encodings), k)
+
+
+class GallerySnapshot:
+    """
+    One published generation of every enrolled face, memory-mapped read-only.
+
+    Rows are sorted by (field, course, id), so each cohort is a contiguous
+    slice of the mapped matrix and costs no copy. Every worker maps the same
+    files, so the pages are shared through the OS page cache.
+
+    Layout of <root>/gen-<N>/: matrix.npy (N, 128) float32, sq_norms.npy (N,)
+    and rows.json (ids, rolls, names and the [field, course, start, end]
+    range of each cohort).
+    """
+
+    def __init__(self, directory, generation):
+        self.generation = generation
+        meta = json.loads((directory / 'rows.json').read_text())
+        mmap_mode = 'r' if meta['ids'] else None  # empty files cannot be mapped
+        self.matrix = np.load(directory / 'matrix.npy', mmap_mode=mmap_mode)
+        self.sq_norms = np.load(directory / 'sq_norms.npy', mmap_mode=mmap_mode)
+        self.ids = np.asarray(meta['ids'], dtype=np.int64)
+        self.rolls = np.asarray(meta['rolls'], dtype=np.int64)
+        self.names = np.asarray(meta['names'], dtype=object)
+        self.fingerprint = meta['fingerprint']
+        self._ranges = {(f, c): (start, end) for f, c, start, end in meta['cohorts']}
+        self._cohorts = {}
+
+    def cohort(self, field, course):
+        """Rows of one field/course; (None, None) is every enrolled face."""
+        cohort = self._cohorts.get((field, course))
+        if cohort is None:
+            if field is None and course is None:
+                start, end = 0, len(self.ids)
+            else:
+                start, end = self._ranges.get((field, course), (0, 0))
+            cohort = Cohort(
+                ids=self.ids[start:end],
+                rolls=self.rolls[start:end],
+                names=self.names[start:end],
+                matrix=self.matrix[start:end],
+                sq_norms=self.sq_norms[start:end],
+            )
+            self._cohorts[(field, course)] = cohort
+        return cohort
+
+    def keys(self):
+        """(field, course) of every cohort in the snapshot."""
+        return list(self._ranges)
+
+    @staticmethod
+    def write(directory, base=None, changed=()):
+        """
+        Dump every enrolled face into `directory`. With a `base` snapshot
+        only the `changed` (field, course) cohorts are read from the
+        database and the rest are copied from `base`; if the result does not
+        match the table (rows written elsewhere), everything is re-read.
+        """
+        from app.models.models import User
+
+        fingerprint = table_fingerprint()
+        if base is not None:
+            changed = set(changed)
+            parts = {key: base.cohort(*key) for key in base.keys() if key not in changed}
+            for field, course in changed:
+                ids, matrix, rolls, names = load_face_matrix(User.roll, User.username, field=field, course=course)
+                if len(ids):
+                    parts[(field, course)] = _cohort(ids, matrix, rolls, names)
+            count = sum(len(part) for part in parts.values())
+            max_id = max((int(part.ids[-1]) for part in parts.values() if len(part)), default=0)
+            if [count, max_id] != fingerprint:
+                base = None
+        if base is None:
+            parts = _split_cohorts(*load_face_matrix(User.roll, User.username, User.field, User.course))
+
+        keys = sorted(parts)
+        cohorts, pos = [], 0
+        for key in keys:
+            cohorts.append(list(key) + [pos, pos + len(parts[key])])
+            pos += len(parts[key])
+
+        directory.mkdir(parents=True)
+        if keys:
+            np.save(directory / 'matrix.npy', np.concatenate([parts[k].matrix for k in keys]))
+            np.save(directory / 'sq_norms.npy', np.concatenate([parts[k].sq_norms for k in keys]))
+        else:
+            matrix = stack_faces([])
+            np.save(directory / 'matrix.npy', matrix)
+            np.save(directory / 'sq_norms.npy', matching.squared_norms(matrix))
+        (directory / 'rows.json').write_text(json.dumps({
+            'ids': [int(i) for k in keys for i in parts[k].ids],
+            'rolls': [int(r) for k in keys for r in parts[k].rolls],
+            'names': [n for k in keys for n in parts[k].names],
+            'cohorts': cohorts,
+            'fingerprint': fingerprint,
+        }))
+
+
+def _split_cohorts(ids, matrix, rolls, names, fields, courses):
+    """{(field, course): Cohort} from one id-ordered load of every face."""
+    rows = {}
+    for i in range(len(ids)):
+        rows.setdefault((fields[i], courses[i]), []).append(i)
+    return {
+        key: _cohort(ids[index], matrix[index], [rolls[i] for i in index], [names[i] for i in index])
+        for key, index in rows.items()
+    }
+
+
+def _cohort(ids, matrix, rolls, names):
+    return Cohort(
+        ids=ids,
+        rolls=np.asarray(rolls, dtype=np.int64),
+        names=np.asarray(names, dtype=object),
+        matrix=matrix,
+    )
+
+
+class FaceGallery:
+    """
+    Process-wide cache of face embeddings, keyed by (field, course).
+
+    Shared mode (configure(path=...)): cohorts are slices of a memory-mapped
+    GallerySnapshot under `path`. invalidate() publishes a new generation,
+    re-reading only the cohorts it names, and bumps the `generation` file; every worker notices the bump on its
+    next lookup and remaps. With `--preload` the master maps the snapshot
+    once and workers inherit it. Every `ttl` seconds the snapshot is also
+    checked against the table, so rows written elsewhere (another host,
+    manual SQL) are picked up.
+
+    Without a path, cohorts are loaded lazily per process and dropped with
+    invalidate(); other workers pick up changes once `ttl` seconds have
+    passed.
+    """
+
+    def __init__(self, ttl=60.0):
+        self.ttl = ttl
+        self.path = None
+        self._snapshot = None
+        self._stamp = None
+        self._checked_at = 0.0
+        self._cohorts = {}
+        self._lock = threading.Lock()
+
+    def configure(self, path=None, ttl=None):
+        self.path = Path(path) if path else None
+        if ttl is not None:
+            self.ttl = ttl
+
+    @property
+    def generation(self):
+        return self._snapshot.generation if self._snapshot else None
+
+    def get(self, field, course):
+        if self.path is not None:
+            if time.monotonic() - self._checked_at >= self.ttl:
+                self.ensure_published()
+            return self._current().cohort(field, course)
+
+        key = (field, course)
+        cohort = self._cohorts.get(key)
+        if cohort is not None and time.monotonic() - cohort.loaded_at < self.ttl:
+            return cohort
+
+        cohort = self._load(field, course)
+        with self._lock:
+            self._cohorts[key] = cohort
+        return cohort
+
+    def invalidate(self, *cohorts):
+        """
+        Drop the given (field, course) cohorts, or everything when called
+        without arguments. In shared mode each call publishes a generation,
+        so pass every cohort a request changed in one call, after commit.
+        """
+        if self.path is not None:
+            self.publish(changed=cohorts)
+            return
+        with self._lock:
+            if not cohorts:
+                self._cohorts.clear()
+            for key in cohorts:
+                self._cohorts.pop(tuple(key), None)
+            # the campus-wide set holds every cohort's rows
+            self._cohorts.pop((None, None), None)
+
+    # -- shared snapshot --------------------------------------------------
+    def ensure_published(self):
+        """Map the current generation, publishing one if missing or stale."""
+        if self.path is None:
+            return
+        self._checked_at = time.monotonic()
+        if not self._is_fresh():
+            self.publish(only_if_stale=True)
+
+    def _is_fresh(self):
+        try:
+            return self._current().fingerprint == table_fingerprint()
+        except (FileNotFoundError, ValueError, KeyError):
+            return False
+
+    def publish(self, only_if_stale=False, changed=()):
+        """
+        Write a new generation and switch workers to it. With `changed`
+        (field, course) cohorts, only those are re-read from the database
+        and the rest are copied from the current generation.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / 'generation.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # another worker may have republished while we waited for the lock
+            if only_if_stale and self._is_fresh():
+                return
+            base = None
+            if changed:
+                try:
+                    base = self._current()
+                except (FileNotFoundError, ValueError, KeyError):
+                    pass
+            generation = self._read_generation() + 1
+            GallerySnapshot.write(self.path / f"gen-{generation}", base, [tuple(key) for key in changed])
+            tmp = self.path / 'generation.tmp'
+            tmp.write_text(str(generation))
+            os.replace(tmp, self.path / 'generation')
+            # workers still mapping an older generation keep their mapping
+            for old in self.path.glob('gen-*'):
+                if old.name != f"gen-{generation}":
+                    shutil.rmtree(old, ignore_errors=True)
+        self._current()
+
+    def _read_generation(self):
+        try:
+            return int((self.path / 'generation').read_text())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _current(self):
+        """The mapped snapshot, remapped when the generation file has moved."""
+        for attempt in range(3):
+            st = os.stat(self.path / 'generation')
+            stamp = (st.st_ino, st.st_mtime_ns)
+            if stamp == self._stamp:
+                return self._snapshot
+            with self._lock:
+                if stamp == self._stamp:
+                    return self._snapshot
+                generation = self._read_generation()
+                try:
+                    self._snapshot = GallerySnapshot(self.path / f"gen-{generation}", generation)
+                except FileNotFoundError:
+                    # superseded and removed while we were reading it
+                    if attempt == 2:
+                        raise
+                    continue
+                self._stamp = stamp
+                return self._snapshot
+
+    def _load(self, field, course):
+        from app.models.models import User
+
+        filters = {} if field is None and course is None else {'field': field, 'course': course}
+        return _cohort(*load_face_matrix(User.roll, User.username, **filters))
+
+
+def table_fingerprint():
+    """(count, max id) of enrolled faces, to spot a snapshot left stale by a restart."""
+    from app.models.models import User
+
+    count, max_id = db.session.query(
+        db.func.count(User.id), db.func.max(User.id)
+    ).filter(User.face_encoding.isnot(None)).one()
+    return [int(count), int(max_id or 0)]
+
+
+def load_face_matrix(*columns, **filters):
+    """
+    One `SELECT id, face_encoding[, columns...]` over attendance_student,
+    returned as (ids, (N, 128) float32 matrix, *column value lists) without
+    hydrating User objects or decoding rows one by one.
+    """
+    from app.models.models import User
+
+    raw = type_coerce(User.face_encoding, LargeBinary)
+    query = db.select(User.id, raw, *columns).where(User.face_encoding.isnot(None))
+    for name, value in filters.items():
+        query = query.where(getattr(User, name) == value)
+    rows = db.session.execute(query.order_by(User.id.asc())).all()
+
+    ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    matrix = stack_faces(r[1] for r in rows)
+    extras = [[r[i] for r in rows] for i in range(2, 2 + len(columns))]
+    return (ids, matrix, *extras)
+
+
+gallery = FaceGallery()
@@ -0,0 +1,83 @@
+"""
+Getting camera frames out of a request and into an RGB array.
+
+Frames may arrive as a raw `image/jpeg` (or png) body, as an `image` file
+in a multipart form, or - for older clients - as a base64 data URL inside
+JSON or form fields. JPEGs are decoded with PIL's draft mode, which lets
+libjpeg scale by 1/2, 1/4 or 1/8 while decoding instead of producing a
+full-size bitmap that is then shrunk.
+"""
+import base64
+import binascii
+from io import BytesIO
+
+import numpy as np
+
+
+RAW_IMAGE_TYPES = {'image/jpeg', 'image/png', 'image/webp', 'application/octet-stream'}
+
+
+class BadImage(ValueError):
+    pass
+
+
+def request_params(req):
+    """Non-image parameters (field, course, ...) wherever the client put them."""
+    if req.is_json:
+        return req.get_json(silent=True) or {}
+    if req.form:
+        return req.form
+    return req.args
+
+
+def request_image_bytes(req):
+    """Encoded image bytes from a raw body, a multipart file or a data URL."""
+    if req.mimetype in RAW_IMAGE_TYPES:
+        return req.get_data(cache=False) or None
+
+    upload = req.files.get('image')
+    if upload is not None:
+        return upload.read() or None
+
+    data_url = request_params(req).get('image') or ''
+    if not data_url:
+        return None
+    if not data_url.startswith('data:image'):
+        raise BadImage("Image must be a data:image URL.")
+    try:
+        return base64.b64decode(data_url.partition(',')[2], validate=True)
+    except (binascii.Error, ValueError):
+        raise BadImage("Image data is not valid base64.")
+
+
+def decode_image(data, max_side=None):
+    """
+    Encoded bytes -> RGB uint8 array whose longest side is at most `max_side`
+    (aspect ratio preserved; no upscaling).
+    """
+    import cv2
+    from PIL import Image
+
+    try:
+        img = Image.open(BytesIO(data))
+        if max_side:
+            w, h = img.size
+            scale = min(1.0, max_side / max(w, h))
+            # JPEG only: decode straight to the nearest 1/2^n size >= target
+            img.draft('RGB', (int(w * scale), int(h * scale)))
+        rgb = np.asarray(img.convert('RGB'))
+    except Exception as e:
+        raise BadImage(f"Image could not be decoded: {e}")
+
+    if max_side and max(rgb.shape[:2]) > max_side:
+        scale = max_side / max(rgb.shape[:2])
+        rgb = cv2.resize(rgb, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return rgb
+
+
+def read_request_image(req, max_side=None):
+    """RGB frame from the current request; raises BadImage when missing or broken."""
+    data = request_image_bytes(req)
+    if not data:
+        raise BadImage("No image received.")
+    return decode_image(data, max_side)
@@ -0,0 +1,74 @@
+from collections import namedtuple
+
+import numpy as np
+
+
+# index/distance refer to the best gallery row; margin is how much further
+# away the runner-up is (inf when the gallery holds a single face).
+Match = namedtuple('Match', ['index', 'distance', 'margin'])
+
+
+def squared_norms(matrix):
+    """Row-wise squared L2 norms, cached by callers alongside the gallery matrix."""
+    return np.einsum('ij,ij->i', matrix, matrix)
+
+
+def pairwise_distances(matrix, probes, matrix_sq_norms=None):
+    """
+    Euclidean distances between M probe encodings and N gallery rows as an
+    (M, N) array, computed with a single matrix product.
+    """
+    probes = np.atleast_2d(np.asarray(probes, dtype=matrix.dtype))
+    if matrix_sq_norms is None:
+        matrix_sq_norms = squared_norms(matrix)
+
+    sq = squared_norms(probes)[:, None] + matrix_sq_norms[None, :] - 2.0 * (probes @ matrix.T)
+    np.maximum(sq, 0.0, out=sq)
+    return np.sqrt(sq)
+
+
+def top_k(distances, k):
+    """
+    Indices and distances of the k nearest gallery rows for each probe,
+    nearest first. Ties are broken by gallery row so results never depend
+    on sort stability.
+    """
+    distances = np.atleast_2d(distances)
+    n = distances.shape[1]
+    k = min(k, n)
+    if k <= 0:
+        empty = np.empty((distances.shape[0], 0))
+        return empty.astype(np.int64), empty
+
+    if k < n:
+        candidates = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(n), distances.shape)
+
+    candidate_distances = np.take_along_axis(distances, candidates, axis=1)
+    order = np.lexsort((candidates, candidate_distances), axis=1)
+    indices = np.take_along_axis(candidates, order, axis=1)
+    return indices, np.take_along_axis(candidate_distances, order, axis=1)
+
+
+def best_matches(distances):
+    """One Match per probe row of an (M, N) distance array (N >= 1)."""
+    indices, nearest = top_k(distances, 2)
+    matches = []
+    for row_indices, row_distances in zip(indices, nearest):
+        margin = row_distances[1] - row_distances[0] if len(row_distances) > 1 else np.inf
+        matches.append(Match(int(row_indices[0]), float(row_distances[0]), float(margin)))
+    return matches
+
+
+def verdict(match, tolerance, min_margin):
+    """
+    'match' when `match` is within tolerance and clearly ahead of the
+    runner-up, 'ambiguous' when within tolerance but not clearly ahead,
+    else 'no-match' (also for None, an empty gallery).
+    """
+    if match is None or match.distance > tolerance:
+        return 'no-match'
+    if match.margin < min_margin:
+        return 'ambiguous'
+    return 'match'
@@ -0,0 +1,32 @@
+import time
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """
+    Wall-clock milliseconds per pipeline stage (decode, detect, encode, ...),
+    reported in the JSON body and as a Server-Timing header.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000.0
+            self.stages[name] = round(self.stages.get(name, 0.0) + elapsed, 2)
+
+    def as_dict(self):
+        return dict(self.stages)
+
+    def header(self):
+        return ', '.join(f"{name};dur={ms}" for name, ms in self.stages.items())
+
+    def apply(self, response):
+        """Attach the timings to a Flask response (as returned by jsonify)."""
+        response.headers['Server-Timing'] = self.header()
+        return response
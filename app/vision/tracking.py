@@ -0,0 +1,106 @@
+"""
+Face tracking across the frames of one camera stream.
+
+Boxes from the detector are associated with the previous frame's tracks by
+greedy IoU matching. A track keeps the identity it was given when first
+encoded, so a student standing in front of the kiosk is encoded once, not
+on every frame. A track is sent to the encoder only when it is new, when it
+is still unidentified (retried every `retry_every` frames), or every
+`reverify_every` frames to catch an identity swap when two faces cross.
+"""
+import itertools
+
+import numpy as np
+
+
+class Track:
+    __slots__ = ('id', 'box', 'result', 'misses', 'age', 'encoded_at')
+
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.result = None      # last match result dict, None until encoded
+        self.misses = 0         # consecutive frames without a matching box
+        self.age = 0            # frames since the track was created
+        self.encoded_at = None  # age when it was last encoded
+
+    @property
+    def identified(self):
+        return self.result is not None and self.result.get('status') == 'match'
+
+
+def iou(boxes_a, boxes_b):
+    """IoU matrix between two lists of (top, right, bottom, left) boxes."""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    top = np.maximum(a[:, None, 0], b[None, :, 0])
+    right = np.minimum(a[:, None, 1], b[None, :, 1])
+    bottom = np.minimum(a[:, None, 2], b[None, :, 2])
+    left = np.maximum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(bottom - top, 0, None) * np.clip(right - left, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 1] - a[:, 3])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 1] - b[:, 3])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+class FaceTracker:
+    def __init__(self, iou_threshold=0.3, max_misses=5, retry_every=3, reverify_every=30):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.retry_every = retry_every
+        self.reverify_every = reverify_every
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+    def update(self, boxes):
+        """
+        Feed one frame's boxes. Returns (tracks to encode, tracks dropped).
+        Every returned track to encode has its `box` set to this frame's box.
+        """
+        for track in self.tracks:
+            track.age += 1
+
+        matched_tracks, matched_boxes = set(), set()
+        if self.tracks and boxes:
+            overlap = iou([t.box for t in self.tracks], boxes)
+            # greedy: best remaining pair first
+            for flat in np.argsort(overlap, axis=None)[::-1]:
+                ti, bi = np.unravel_index(flat, overlap.shape)
+                if overlap[ti, bi] < self.iou_threshold:
+                    break
+                if ti in matched_tracks or bi in matched_boxes:
+                    continue
+                matched_tracks.add(ti)
+                matched_boxes.add(bi)
+                self.tracks[ti].box = boxes[bi]
+                self.tracks[ti].misses = 0
+
+        dropped = []
+        kept = []
+        for ti, track in enumerate(self.tracks):
+            if ti not in matched_tracks:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    dropped.append(track)
+                    continue
+            kept.append(track)
+        self.tracks = kept
+
+        for bi, box in enumerate(boxes):
+            if bi not in matched_boxes:
+                self.tracks.append(Track(next(self._ids), box))
+
+        return [t for t in self.tracks if t.misses == 0 and self._due(t)], dropped
+
+    def record(self, track, result):
+        track.result = result
+        track.encoded_at = track.age
+
+    def _due(self, track):
+        if track.encoded_at is None:
+            return True
+        since = track.age - track.encoded_at
+        if track.identified:
+            return since >= self.reverify_every
+        return since >= self.retry_every
@@ -0,0 +1,48 @@
+"""
+Warm-up run once per web worker before it serves traffic, and the state
+behind /ready.
+
+Vision and cloud libraries are imported on first use, so a cold worker's
+first scan would otherwise pay for importing OpenCV and dlib, loading the
+face cascade and the dlib models, and mapping the face gallery.
+"""
+import time
+from io import BytesIO
+
+
+state = {'ready': False, 'seconds': None, 'error': None}
+
+
+def preload_models():
+    """Import the vision stack in this process (the gunicorn master under --preload)."""
+    import cv2  # noqa: F401
+    import face_recognition  # noqa: F401
+
+
+def warm_up(app):
+    """Run one decode, detect, encode and gallery lookup; then report ready."""
+    from app import config
+    from app.vision.detection import detect_faces
+    from app.vision.encoder import encoder, WARM_FRAME, WARM_BOX
+    from app.vision.gallery import gallery
+    from app.vision.imaging import decode_image
+
+    start = time.perf_counter()
+    try:
+        from PIL import Image
+
+        buf = BytesIO()
+        Image.fromarray(WARM_FRAME).save(buf, 'JPEG')
+        frame = decode_image(buf.getvalue(), config.SCAN_FACE_MAX_SIDE)
+        detect_faces(frame, config.FACE_DETECTOR)
+        encoder.encode(WARM_FRAME, [WARM_BOX], deadline=time.time() + 120)
+        with app.app_context():
+            gallery.get(None, None)
+    except Exception as e:
+        state['error'] = str(e)
+        app.logger.error(f"Warm-up failed: {e}")
+        return False
+
+    state.update(ready=True, error=None, seconds=round(time.perf_counter() - start, 3))
+    app.logger.info(f"Warm-up finished in {state['seconds']}s")
+    return True
@@ -0,0 +1,80 @@
+"""
+Recall and latency of the campus-wide ANN index against brute force.
+
+    python -m benchmarks.ann_benchmark [--sizes 1000 10000 100000] [--queries 200]
+
+Embeddings are synthetic: every "student" is a random 128-d point with
+face_recognition-like spread, and each query is a noisy re-scan of a random
+student. Recall@1 is measured against the exact brute-force nearest neighbour.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.vision import matching
+from app.vision.ann import IVFIndex, HNSWIndex
+
+
+def synthetic_gallery(n, rng, dim=128):
+    vectors = rng.normal(0.0, 0.09, size=(n, dim)).astype(np.float32)
+    return np.arange(1, n + 1, dtype=np.int64), vectors
+
+
+def synthetic_queries(vectors, count, rng):
+    picks = rng.integers(0, len(vectors), size=count)
+    noise = rng.normal(0.0, 0.02, size=(count, vectors.shape[1])).astype(np.float32)
+    return vectors[picks] + noise
+
+
+def time_queries(search, queries):
+    found = []
+    start = time.perf_counter()
+    for q in queries:
+        found.append(search(q))
+    elapsed = time.perf_counter() - start
+    return np.array(found), elapsed / len(queries) * 1000.0
+
+
+def run(sizes, query_count, seed=0):
+    rng = np.random.default_rng(seed)
+    backends = [('ivf', lambda: IVFIndex())]
+    try:
+        import hnswlib  # noqa: F401
+        backends.append(('hnsw', lambda: HNSWIndex()))
+    except ImportError:
+        print("hnswlib not installed; skipping the hnsw backend.")
+
+    print(f"{'N':>8} {'backend':>8} {'build s':>9} {'ms/query':>9} {'recall@1':>9}")
+    for n in sizes:
+        ids, vectors = synthetic_gallery(n, rng)
+        queries = synthetic_queries(vectors, query_count, rng)
+        sq_norms = matching.squared_norms(vectors)
+
+        def brute(q):
+            return ids[matching.pairwise_distances(vectors, q, sq_norms)[0].argmin()]
+
+        exact, brute_ms = time_queries(brute, queries)
+        print(f"{n:>8} {'brute':>8} {0.0:>9.2f} {brute_ms:>9.3f} {1.0:>9.3f}")
+
+        for name, factory in backends:
+            index = factory()
+            start = time.perf_counter()
+            index.build(ids, vectors)
+            build_s = time.perf_counter() - start
+
+            approx, ms = time_queries(lambda q: index.search(q, k=1)[0][0, 0], queries)
+            recall = float((approx == exact).mean())
+            print(f"{n:>8} {name:>8} {build_s:>9.2f} {ms:>9.3f} {recall:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+    run(args.sizes, args.queries)
+
+
+if __name__ == '__main__':
+    main()
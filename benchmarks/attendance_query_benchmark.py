@@ -0,0 +1,151 @@
+"""
+Query plans and latencies for the per-day attendance lookups, before and
+after the sargable date predicates and composite indexes.
+
+    python -m benchmarks.attendance_query_benchmark [--rows 1000000] [--database URL]
+
+Seeds a scratch database (SQLite file by default; pass a PostgreSQL URL to
+test there) with `--rows` attendance rows spread over 2,000 students in 20
+cohorts, then runs each lookup three ways:
+
+    func.date   - the old `func.date(Attendance.date) == day`, no indexes
+    range       - half-open timestamp range, still no indexes
+    range+index - half-open range with the new composite indexes
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, select, text, insert
+
+from app.attendance import on_day
+from app.models.models import User, Attendance
+
+
+STUDENTS = 2000
+COHORTS = [(f"Field{f}", f"Course{c}") for f in range(5) for c in range(4)]
+STATUSES = ['✅Present', '⏰Present-Late', '❌Absent']
+
+
+def seed(engine, rows, rng):
+    users, attendance = User.__table__, Attendance.__table__
+    attendance.drop(engine, checkfirst=True)
+    users.drop(engine, checkfirst=True)
+    users.create(engine)
+    attendance.create(engine)
+    drop_indexes(engine)
+
+    students = []
+    for i in range(1, STUDENTS + 1):
+        field, course = COHORTS[i % len(COHORTS)]
+        students.append({'id': i, 'username': f"Student {i}", 'email': f"s{i}@example.com",
+                         'roll': i, 'field': field, 'course': course})
+    with engine.begin() as conn:
+        conn.execute(insert(users), students)
+
+    days = max(1, rows // STUDENTS)
+    first_day = datetime(2024, 1, 1)
+    chunk = []
+    with engine.begin() as conn:
+        for n in range(rows):
+            s = students[n % STUDENTS]
+            day = first_day + timedelta(days=n // STUDENTS)
+            chunk.append({
+                'student_id': s['id'], 'field': s['field'], 'course': s['course'],
+                'date': day + timedelta(seconds=rng.randrange(8 * 3600, 12 * 3600)),
+                'status': rng.choice(STATUSES),
+            })
+            if len(chunk) == 50_000:
+                conn.execute(insert(attendance), chunk)
+                chunk = []
+        if chunk:
+            conn.execute(insert(attendance), chunk)
+    return (first_day + timedelta(days=days // 2)).date()
+
+
+def drop_indexes(engine):
+    with engine.begin() as conn:
+        for table in (User.__table__, Attendance.__table__):
+            for index in table.indexes:
+                conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+
+
+def create_indexes(engine):
+    with engine.begin() as conn:
+        for table in (User.__table__, Attendance.__table__):
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+        if conn.dialect.name == 'postgresql':
+            conn.execute(text("ANALYZE"))
+
+
+def queries(day, by_range):
+    def day_filter():
+        return on_day(Attendance.date, day) if by_range else func.date(Attendance.date) == day
+
+    field, course = COHORTS[0]
+    return {
+        'already marked? (student, day)': select(Attendance.id).where(
+            Attendance.student_id == 20, Attendance.field == field,
+            Attendance.course == course, day_filter()
+        ),
+        'cohort dashboard (field, course, day)': select(Attendance.student_id, Attendance.status).where(
+            Attendance.field == field, Attendance.course == course, day_filter()
+        ),
+        'absentees (status, day)': select(Attendance.student_id).where(
+            Attendance.status == '❌Absent', day_filter()
+        ),
+    }
+
+
+def explain(conn, stmt):
+    sql = str(stmt.compile(conn, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+    rows = conn.execute(text(prefix + sql)).all()
+    return ' | '.join(str(r[-1]) for r in rows)
+
+
+def measure(conn, stmt, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(stmt).all()
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return statistics.median(timings)
+
+
+def report(engine, label, day, by_range, repeat):
+    print(f"\n== {label} ==")
+    with engine.connect() as conn:
+        for name, stmt in queries(day, by_range).items():
+            ms = measure(conn, stmt, repeat)
+            print(f"{name:<40} {ms:>9.2f} ms   {explain(conn, stmt)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--database', help="SQLAlchemy URL (default: a temporary SQLite file)")
+    args = parser.parse_args()
+
+    url = args.database or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_engine(url)
+
+    start = time.perf_counter()
+    day = seed(engine, args.rows, random.Random(0))
+    print(f"Seeded {args.rows} attendance rows in {time.perf_counter() - start:.1f}s ({url})")
+
+    report(engine, "func.date (before)", day, by_range=False, repeat=args.repeat)
+    report(engine, "range, no indexes", day, by_range=True, repeat=args.repeat)
+    create_indexes(engine)
+    report(engine, "func.date with indexes", day, by_range=False, repeat=args.repeat)
+    report(engine, "range + indexes (after)", day, by_range=True, repeat=args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Web app startup cost: import time and first-request latency.
+
+    python -m benchmarks.startup_benchmark [--runs 5]
+
+Every run is a fresh interpreter (FACE_ENCODER_WORKERS=0, so encodes run
+in-process and their cold cost is visible) that reports:
+
+    import app        - `import app`, module-level imports only
+    create_app        - `import run` plus start_background(), as a gunicorn worker
+                        loads the app and then runs its post_worker_init hook
+    first scan        - first POST /scan-face with a blank JPEG (decode + detect)
+    first encode      - first 128-d encode (dlib model initialisation)
+    second scan/encode- the same again, steady state
+
+Uses DATABASE_URL if set, otherwise a temporary SQLite file.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+
+CHILD = r"""
+import io, json, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+import run
+run.start_background(run.app)
+t2 = time.perf_counter()
+
+import numpy as np
+from PIL import Image
+from app.vision.encoder import encoder
+
+buf = io.BytesIO()
+Image.new('RGB', (320, 240)).save(buf, 'JPEG')
+client = run.app.test_client()
+
+def scan():
+    start = time.perf_counter()
+    client.post('/scan-face?field=Bench&course=Bench', data=buf.getvalue(), content_type='image/jpeg')
+    return time.perf_counter() - start
+
+def encode():
+    start = time.perf_counter()
+    encoder.encode(np.zeros((160, 160, 3), dtype=np.uint8), [(0, 150, 150, 0)])
+    return time.perf_counter() - start
+
+first_scan, first_encode = scan(), encode()
+second_scan, second_encode = scan(), encode()
+print(json.dumps({
+    'import app': t1 - t0,
+    'create_app': t2 - t1,
+    'first scan': first_scan,
+    'first encode': first_encode,
+    'second scan': second_scan,
+    'second encode': second_encode,
+}))
+"""
+
+
+def run_once(env):
+    out = subprocess.run(
+        [sys.executable, '-c', CHILD], env=env, capture_output=True, text=True, check=True,
+        cwd=Path(__file__).resolve().parent.parent,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp()
+    env = dict(os.environ, FACE_ENCODER_WORKERS='0')
+    env.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(scratch, 'startup.db')}")
+    env.setdefault('FACE_INDEX_PATH', os.path.join(scratch, 'face_index.npz'))
+    env.setdefault('FACE_GALLERY_PATH', os.path.join(scratch, 'face_gallery'))
+
+    run_once(env)  # create tables and snapshots so every measured run starts alike
+    runs = [run_once(env) for _ in range(args.runs)]
+    for name in runs[0]:
+        values = [r[name] * 1000.0 for r in runs]
+        print(f"{name:<15} median {statistics.median(values):>9.1f} ms   "
+              f"min {min(values):>9.1f} ms   max {max(values):>9.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
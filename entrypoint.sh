@@ -4,5 +4,7 @@ set -e
 # Default PORT locally; Railway provides PORT automatically
 export PORT="${PORT:-8000}"
 
-# Gunicorn: 2 workers keeps memory low; thread worker helps with I/O
-exec gunicorn -w 2 -k gthread -b 0.0.0.0:${PORT} run:app
+# Gunicorn: 2 workers keeps memory low; thread worker helps with I/O.
+# Each /scan-stream kiosk holds one thread for as long as it is connected,
+# as does each live dashboard (at most LIVE_MAX_STREAMS per worker).
+exec gunicorn -w 2 -k gthread --threads "${GUNICORN_THREADS:-8}" -b 0.0.0.0:${PORT} run:app
@@ -0,0 +1,38 @@
+"""
+Gunicorn settings; `gunicorn run:app` reads this file from the working
+directory. Command-line flags (entrypoint.sh) still take precedence.
+
+create_app() leaves the encoder pool, warm-up and scheduler alone (CLI
+commands build the app too), so the hooks below start them in every worker
+once it has the app.
+
+GUNICORN_PRELOAD=true imports the app once in the master: the dlib models,
+the mapped face gallery and the campus index are then shared with every
+worker copy-on-write instead of being loaded again per worker.
+"""
+import os
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "false").lower() == "true"
+
+
+def when_ready(server):
+    # master, after the preloaded app and before the first fork
+    if preload_app:
+        from app import warmup
+
+        warmup.preload_models()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from app import after_fork
+
+        after_fork(server.app.wsgi())
+
+
+def post_worker_init(worker):
+    # the worker has just imported the app itself
+    if not preload_app:
+        from app import start_background
+
+        start_background(worker.wsgi)
@@ -1,4 +1,4 @@
-from app import create_app, db
+from app import create_app, db, start_background
 
 app = create_app()
 
@@ -6,4 +6,5 @@ app = create_app()
 if __name__ == "__main__":
     with app.app_context():
         db.create_all()
+    start_background(app)
     app.run(host="0.0.0.0", port=5000, debug=True)